@@ -22,23 +22,8 @@ Interpret a blob as pixels for a raster image
 
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from itertools import chain, repeat
 from math import ceil
-
-def _intble_iter(v, l):
-    """
-    Integer as Bytes in Little Endian Iterator:
-    Convert Python integer v to a litte-endian byte array
-    of length l. Yield one byte at a time as an iter.
-    """
-    if v == 0:
-        for i in range(l): yield 0
-    else:
-        vmax = 2**(l*8)-1
-        if v > vmax:
-            raise ValueError(f"highest value for {l} byte uint is {vmax}")
-        for i in range(1, l+1):
-            yield (v & (2**(i*8)-1)) >> (i-1)*8
+from struct import pack, pack_into
 
 class BlobPic:
     ACCEPTED_BPPS = [1, 8, 24]
@@ -58,20 +43,20 @@ class BlobPic:
         if self.bpp not in self.ACCEPTED_BPPS:
             raise ValueError(f"valid values of bpp are: {self.ACCEPTED_BPPS}")
 
+    # eight-bit greyscale palette, see _bmp_color_entries()
+    _PAL8 = b''.join(bytes((x, max(x,2), max(x,20), 255)) for x in range(256))
+
     def _bmp_color_entries(self):
-        """Return the colour table for a BMP file"""
+        """Return the colour table for a BMP file as bytes"""
          # BMP colours seems to be stored as BGRA,
          # or ARGB little-endian
         if self.bpp == 1:
             # one-bit black & white, or ink and paper
-            return (
-                b'\xFF\xF0\x00\xFF',
-                b'\xC8\xEE\xEE\xFF',
-            ) # off-white background
+            return b'\xFF\xF0\x00\xFF\xC8\xEE\xEE\xFF' # off-white background
         elif self.bpp == 8:
             # eight-bit greyscale
-            return (bytes((x, max(x,2), max(x,20),255)) for x in range(256))
-        else: return () # no index, pixel-by-pixel RGB
+            return self._PAL8
+        else: return b'' # no index, pixel-by-pixel RGB
 
     def _bmp_nce(self):
         """Return number of palette/colour table entries"""
@@ -88,60 +73,45 @@ class BlobPic:
         Return the number of bytes of padding per pixel row
         needed for a BMP image
         """
-        return ceil(self._px_bytes(self.w)/4)*4 - self._px_bytes(self.w)
-
-    def _bmp_row_iter(self):
-        """
-        Return an iter yielding the image data for a BMP image,
-        row-by-row with padding. Rows are yielded as bytes objects,
-        aligned to a multiple of four bytes.
-        """
-        img = chain(iter(self.blob), repeat(0))
-        for r in range(self.h):
-            yield bytes(chain(
-                (next(img) for i in range(self._px_bytes(self.w))),
-                (0 for j in range(self._bmp_wpad())),
-            ))
+        return -self._px_bytes(self.w) % 4 # round up to next multiple of 4
 
     def bmp(self):
         """
-        Returns bytes for a Microsoft BMP Image, using the
+        Returns a bytearray for a Microsoft BMP Image, using the
         1992 standard (BITMAPINFOHEADER)
         """
-        MAGIC = b'BM'
-        INFO_A = b'\x00\x00'
-        INFO_B = b'\x00\x00'
         # Using 1992 BMP (BITMAPINFOHEADER)
         #  1987 BMP (BITMAPCOREHEADER) would have worked, but I
         #  was too lazy to flip the rows to deal with the
         #  bottom-to-top row order
         HEADER_SIZE = 14 # always 14
-        INFO_SIZE = _intble_iter(40, 4)
-        bmp_width = _intble_iter(self.w, 4)
-        bmp_height = _intble_iter(-self.h, 4)
-        COLOR_PLANES = b'\x01\x00'
-        bmp_bpp = _intble_iter(self.bpp, 2)
-        COMPRESSION = b'\x00\x00\x00\x00' # BI_RGB
-        BLOB_SIZE = b'\x00\x00\x00\x00'
-        res_x = _intble_iter(self.res_x, 4)
-        res_y = _intble_iter(self.res_y, 4)
-        N_ENTRIES = _intble_iter(self._bmp_nce(), 4) # num. of entries
-        COLOR_ENTRIES = self._bmp_color_entries()    # actual entries
-        IMPORTANT_COLORS = _intble_iter(0, 4)
-        ### late calc vars
-        binfo = bytes(chain(INFO_SIZE, bmp_width, bmp_height, COLOR_PLANES,
-            bmp_bpp, COMPRESSION, BLOB_SIZE, res_x, res_y, N_ENTRIES,
-            *COLOR_ENTRIES, IMPORTANT_COLORS
-        ))
-        boff = len(binfo)+HEADER_SIZE # blob offset
-        img = b''.join(self._bmp_row_iter())
-        rowsize = (self._bmp_wpad() + self._px_bytes(self.w))
-        bmpsize = rowsize*self.h
-        allsize = _intble_iter(bmpsize+len(binfo)+HEADER_SIZE, 4)
-        bhead = bytes(chain(
-            MAGIC, allsize, INFO_A, INFO_B, _intble_iter(boff, 4)
-        ))
-        return b''.join((bhead, binfo, img))
+        INFO_SIZE = 40
+        COLOR_PLANES = 1
+        COMPRESSION = 0 # BI_RGB
+        BLOB_SIZE = 0
+        IMPORTANT_COLORS = 0
+        colors = self._bmp_color_entries()
+        boff = HEADER_SIZE+INFO_SIZE+len(colors) # blob offset
+        rowbytes = self._px_bytes(self.w)
+        rowsize = rowbytes + (-rowbytes % 4) # same as _bmp_wpad()
+        allsize = boff + rowsize*self.h
+        # PROTIP: the whole file is written into a pre-zeroed buffer,
+        # row padding and missing pixels at the end of a short blob
+        # are left as zeroes
+        out = bytearray(allsize)
+        pack_into('<2sIHHI', out, 0, b'BM', allsize, 0, 0, boff)
+        pack_into(
+            '<IiiHHIIiiII', out, HEADER_SIZE, INFO_SIZE, self.w, -self.h,
+            COLOR_PLANES, self.bpp, COMPRESSION, BLOB_SIZE, self.res_x,
+            self.res_y, self._bmp_nce(), IMPORTANT_COLORS
+        )
+        out[HEADER_SIZE+INFO_SIZE:boff] = colors
+        src = memoryview(self.blob)
+        for r in range(self.h):
+            row = src[r*rowbytes:(r+1)*rowbytes]
+            i = boff + r*rowsize
+            out[i:i+len(row)] = row
+        return out
 
 ### Test Samples
 #### Alignment Checks
@@ -164,5 +134,7 @@ test_8bpp_12x10_of = BlobPic(12, 10, bytes(range(255,1,-1)), bpp=8)
 #### Fun Stuff
 def test_rainbow(w,h):
     hi = 2**24
-    pixs = b''.join(bytes(_intble_iter(x,3)) for x in range(0,hi,hi//(w*h)))
+    vals = range(0,hi,hi//(w*h))
+    pixs = bytearray(pack(f"<{len(vals)}I", *vals))
+    del pixs[3::4] # keep lowest three bytes of each value
     return BlobPic(w,h,pixs,bpp=24)
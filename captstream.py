@@ -30,10 +30,9 @@ and transport format for print data.
 # end user products.
 #
 
-import pdb
 import os.path
-from argparse import ArgumentParser
-from collections import OrderedDict
+from mmap import mmap, ACCESS_READ
+from struct import unpack_from
 from sys import stdin, stdout
 try:
     from scoa import SCoADecoder
@@ -123,10 +122,14 @@ class CAPTStream:
         self.offsets = []  # see get_offsets() for format
         self._config = None
         self._fh = None
-        self._fh_iter = None
+        self._buf = None # data read from self._fh, see _read()
+        self._pos = 0    # offset of next unread byte in self._buf
         self._set_config(version=version)
 
     def __del__(self):
+        if isinstance(self._buf, mmap):
+            try: self._buf.close()
+            except BufferError: pass # slices still in use, leave it to GC
         if self._fh is not stdin.buffer: self._fh.close()
         # TODO: is this necessary?
 
@@ -149,11 +152,34 @@ class CAPTStream:
             self._config = self.CONFIG[v]
         return self._config['version']
 
-    def _packet_first_offsets(self, b, opcodes, bias=0, verify=False):
+    def _read(self):
+        """
+        Return the contents of the job file as a bytes-like object.
+        The file is only read once, later calls return the same object.
+
+        When reading from a file, the whole file is memory-mapped, and
+        the offsets are the same as those in the file. When reading from
+        standard input, only the data following the magic number is
+        read into memory.
+        """
+        if self._buf is None:
+            if self.path:
+                self._pos = self._fh.tell()
+                try:
+                    self._buf = mmap(self._fh.fileno(), 0, access=ACCESS_READ)
+                except (OSError, ValueError):
+                    # empty files and some special files cannot be mapped
+                    self._fh.seek(0)
+                    self._buf = self._fh.read()
+            else:
+                self._buf = self._fh.read()
+        return self._buf
+
+    def _packet_first_offsets(self, buf, opcodes, bias=0, verify=False):
         """
         Return an iter yielding offsets of CAPT packets of interest
-        in a bytes iter ``b``. If there are multiple packets of the same
-        type in a row, only the first packet's offset is yielded.
+        in a bytes-like object ``buf``. If there are multiple packets of
+        the same type in a row, only the first packet's offset is yielded.
 
         When there are multiple packet types of interest, the offsets
         are detected in the same order presented in ``opcodes``.
@@ -173,48 +199,51 @@ class CAPTStream:
         # TODO: Implement verify option; this attempts to detect
         # malformed data in job files.
         #
+        # PROTIP: bytes.find() does the byte-by-byte search in C; only
+        # the packets that match are handled in Python
         n_codes = len(opcodes)
-        last_code = None
-        last_byte = next(b)
-        i = 1
+        i = 0
         i_op = 0
         offsets = [0,] * n_codes
-        for x in b:
-            code = bytes((last_byte, x))
-            if code == opcodes[i_op]:
-                offsets[i_op] = i-1 + bias
-                if i_op >= n_codes-1:
-                    yield offsets
-                    offsets = [0,] * n_codes
-                    # PROTIP: lists must be recreated from scratch or the
-                    # multiple references to the same list will be yielded,
-                    # making results incorrect.
-                vl = next(b)
-                vh = next(b)
-                vskip = WORD(vl, vh)-4 or 1
-                for j in range(vskip): next(b)
-                i += vskip + 2
-                i_op = (i_op+1) % n_codes
-            last_code = code
-            last_byte = x
-            i += 1
-
-    def extract_packets(self, b, opcode, end_code, n=None, yield_end=False):
+        while True:
+            i = buf.find(opcodes[i_op], i)
+            if i < 0 or i+PACKET_HEADER_SIZE > len(buf): return
+            offsets[i_op] = i + bias
+            if i_op >= n_codes-1:
+                yield offsets
+                offsets = [0,] * n_codes
+                # PROTIP: lists must be recreated from scratch or the
+                # multiple references to the same list will be yielded,
+                # making results incorrect.
+            size, = unpack_from('<H', buf, i+2)
+            i += max(size, PACKET_HEADER_SIZE)
+            i_op = (i_op+1) % n_codes
+
+    def extract_packets(
+            self, buf, opcode, end_code, n=None, yield_end=False, start=0,
+            end=None
+        ):
         """
         Extract CAPT packets of a specific ``opcode``, from the
-        yielded bytes of a byte iterator ``b``. Stop when n packets
-        are extracted, or when a terminating opcode ``end_code`` is
-        encountered, whichever comes first.
+        bytes-like object ``buf``, beginning at offset ``start``.
+        Only packets starting before offset ``end`` are extracted,
+        set end=None to search until the end of ``buf``.
+        Stop when n packets are extracted, or when a terminating
+        opcode ``end_code`` is encountered, whichever comes first.
 
-        Returned data is yielded via an iter, byte-by-byte.
+        Returned data is yielded via an iter, packet-by-packet, as
+        memoryview slices of ``buf``. Use b''.join() to collect the
+        data into a single bytes object.
 
         Set n=None to extract all packets in the stream of type
         ``opcode``.
 
         When ``yield_end`` is True, the contents of the end_code
-        packet, if present, is yielded as well. If set to False, the
-        iterator will still be advanced to the byte after the
-        end_code packet if there are still bytes left in ``b``.
+        packet, if present, is yielded as well.
+
+        When the iter is exhausted, the offset of the byte after
+        the last packet processed (including the end_code packet)
+        is stored in ``self._pos``.
 
         NOTES
         =====
@@ -223,44 +252,66 @@ class CAPTStream:
         including the header. For details, see the SPECS file in
         captdriver.
         """
-        last_byte = next(b)
-        i = 0
-        k = n or -1
-        for x in b:
-            if n and i >= k: return
-            code = bytes((last_byte, x))
-            termi = code == end_code
-            if code == opcode or termi:
-                vl = next(b)
-                vh = next(b)
-                vlen = WORD(vl, vh)-4
-                if termi and not yield_end:
-                    for j in range(vlen): next(b)
-                    return
-                else:
-                    for j in range(vlen): yield next(b)
-                if termi: return
-                i += 1
-            last_byte = x
-
-    def extract_raster_dims(self, b):
+        if end is None: end = len(buf)
+        mv = memoryview(buf)
+        i = start
+        i_end = -1
+        k = 0
+        while not n or k < n:
+            i_op = buf.find(opcode, i, end)
+            if end_code and i_end < i:
+                i_end = buf.find(end_code, i, end)
+                # PROTIP: the end packet is usually far away, keep its
+                # offset to avoid searching the rest of the page on
+                # every packet
+                if i_end < 0: i_end = end
+            termi = end_code and i_end < end\
+                and (i_op < 0 or i_end < i_op)
+            if termi: i = i_end
+            elif i_op >= 0: i = i_op
+            else:
+                i = end
+                break
+            if i+PACKET_HEADER_SIZE > len(buf):
+                i = len(buf)
+                break
+            size, = unpack_from('<H', buf, i+2)
+            vend = i + max(size, PACKET_HEADER_SIZE)
+            if yield_end or not termi:
+                yield mv[i+PACKET_HEADER_SIZE:vend]
+            i = vend
+            if termi: break
+            k += 1
+        self._pos = i
+
+    def extract_raster_dims(self, buf, start=0, end=None):
         """
-        Read dimensions from the next raster found in the stream of
-        the byte iter ``b``
+        Read dimensions from the next raster found in the bytes-like
+        object ``buf`` between offsets ``start`` and ``end``.
+
+        The offset of the byte after the raster setup packet is
+        stored in ``self._pos``.
 
         """
         if not self._config: raise ValueError(self.MSG_NO_CONFIG)
-        rast_iter = self.extract_packets(b, CAPT_RASTER_SETUP, None, n=1)
-        for i in range(RASTER_LINE_WIDTH_OFFSET): next(rast_iter)
-        line_size = WORD(next(rast_iter), next(rast_iter))
-        h = WORD(next(rast_iter), next(rast_iter))
-        # PROTIP: height is right after line size (fortunately)
+        if end is None: end = len(buf)
+        i = buf.find(CAPT_RASTER_SETUP, start, end)
+        # PROTIP: dimensions are read straight from buf, there is no
+        # need to extract the whole setup packet
+        i_dims = i + PACKET_HEADER_SIZE + RASTER_LINE_WIDTH_OFFSET
+        if i < 0 or i_dims + 4 > len(buf):
+            raise StopIteration # no more pages
+        size, = unpack_from('<H', buf, i+2)
+        # PROTIP: the height immediately follows the line width
+        line_size, h = unpack_from('<HH', buf, i_dims)
+        self._pos = i + max(size, PACKET_HEADER_SIZE)
         return (line_size, h)
 
-    def extract_raster_packets(self, b):
+    def extract_raster_packets(self, buf, start=0, end=None):
         """
-        Extract CAPT packets from byte iter ``b`` that contain raster
-        data. Returned data is yielded via an iter, byte-by-byte.
+        Extract CAPT packets from the bytes-like object ``buf`` that
+        contain raster data, between offsets ``start`` and ``end``.
+        Returned data is yielded via an iter, packet-by-packet.
 
         Please set the stream reader to match the CAPT version used
         by on stream beforehand, see __init__() and _set_config().
@@ -268,14 +319,20 @@ class CAPTStream:
         if not self._config: raise ValueError(self.MSG_NO_CONFIG)
         op_rast_data = self._config['raster_data_opcode']
         op_rast_end = self._config['raster_end_opcode']
-        for x in self.extract_packets(b, op_rast_data, op_rast_end):
-            yield x
+        return self.extract_packets(
+            buf, op_rast_data, op_rast_end, start=start, end=end
+        )
 
-    def extract_next_page(self, b, out_format='raw'):
+    def extract_next_page(self, buf, start=0, out_format='raw', end=None):
         """
-        Extract the first page detected in the byte iter b.
-        Return the extracted page as a ready-to-archive byte array
-        containing headers and metadata.
+        Extract the first page detected in the bytes-like object
+        ``buf`` from offset ``start``. If the end of the page is known,
+        pass its offset as ``end`` to limit the search for packets.
+        Return the extracted page as
+        a ready-to-archive bytearray containing headers and metadata.
+
+        The offset of the byte after the page is stored in
+        ``self._pos``.
 
         Choices for out_format
         ======================
@@ -288,30 +345,40 @@ class CAPTStream:
         Only CAPT 1.x files are properly supported at the moment
 
         """
-        dims = self.extract_raster_dims(b)
-        header = None
-        raw_iter = self.extract_raster_packets(b)
+        dims = self.extract_raster_dims(buf, start, end)
+        packets = list(self.extract_raster_packets(buf, self._pos, end))
         if out_format == 'raw':
-            data = bytes(raw_iter)
             out_fmt = self._config['codec_name']
-            header = HEADER_FMT.format(
+            size = sum(len(x) for x in packets)
+            header = bytes(HEADER_FMT.format(
                 fmt=out_fmt,
                 w=dims[0]*8,
                 h=dims[1],
-                size=len(data)
-            )
+                size=size
+            ), encoding='ascii')
+            # PROTIP: the page size is known in advance, so the output
+            # is allocated once and the packets copied into place
+            out = bytearray(len(header) + size)
+            out[:len(header)] = header
+            i = len(header)
+            for x in packets:
+                out[i:i+len(x)] = x
+                i += len(x)
         elif out_format == 'p4':
             if not SCoADecoder: ValueError(self.MSG_NO_DECODER)
             decoder = SCoADecoder(line_size=dims[0])
-            data = bytes(decoder.decode(raw_iter))
             header = P4_HEADER_FMT.format(w=dims[0]*8, h=dims[1])
+            out = bytearray(header, encoding='ascii')
+            out += decoder.decode_bytes(b''.join(packets))
         else:
             raise ValueError(self.MSG_UNKNOWN_FORMAT)
-        return b''.join((bytes(header, encoding='ascii'), data))
+        return out
 
-    def get_offsets(self, b):
+    def get_offsets(self, buf):
         """
-        Return an iter that yields offsets to page data
+        Return an iter that yields offsets to page data in the
+        bytes-like object ``buf``
+
         Offsets Table Format Summary
         ============================
         [page_head_off [,hiscoa_params_off], raster_head_off, raster_off]
@@ -321,7 +388,7 @@ class CAPTStream:
         """
         if not self._config: raise ValueError(self.MSG_NO_CONFIG)
         codes = self._config['paging_opcodes']
-        for x in self._packet_first_offsets(b, codes):
+        for x in self._packet_first_offsets(buf, codes):
             yield [x[0]-self._config['page_header_size'], x[0], x[1]]
 
     def version(self):
@@ -339,26 +406,21 @@ class CAPTStream:
         For a list of supported output formats, see extract_next_page().
 
         """
+        end = None
         if page:
             if not self._fh.seekable():
                 raise IndexError(self.MSG_NO_PAGE)
             if self.path and not self.offsets:
-                self._fh.seek(0)
-                in_iter = (x for x in self._fh.read())
-                self.offsets = [x for x in self.get_offsets(in_iter)]
+                self.offsets = [x for x in self.get_offsets(self._read())]
             if page > len(self.offsets) or page < 1:
                 raise IndexError(self.MSG_INVALID_PAGE)
             else:
-                self._fh.seek(0)
-                self._fh.seek(self.offsets[page-1][1]) # raster setup offset
-                self._fh_iter = (x for x in self._fh.read())
-        if not self._fh_iter: self._fh_iter = (x for x in self._fh.read())
-        return self.extract_next_page(self._fh_iter, out_format=out_format)
-
-def WORD(lo, hi):
-    """Get integer from 16-bit little-endian word"""
-    # NOTE: Ported from captdriver, see src/word.h
-    return (int(hi) << 8) | int(lo)
+                self._pos = self.offsets[page-1][1] # raster setup offset
+                if page < len(self.offsets):
+                    end = self.offsets[page][0] # next page header offset
+        return self.extract_next_page(
+            self._read(), self._pos, out_format=out_format, end=end
+        )
 
 # Command-line support
 ACT_INFO = 'info'
@@ -383,7 +445,9 @@ def _auto_number_filename(path, n):
             )
 
 if __name__ == '__main__':
-    parser_spec = OrderedDict({
+    from argparse import ArgumentParser
+
+    parser_spec = {
         'desc': 'View information and extract pages from CAPT job files',
         'args': {
             'action': {
@@ -410,7 +474,7 @@ if __name__ == '__main__':
                 'help': 'pages from & including selected page to process'
             }
         }
-    })
+    }
     parser = ArgumentParser(description=parser_spec['desc'])
     args_spec = parser_spec['args']
     for k_arg in args_spec:
@@ -27,9 +27,10 @@ along with this software. If not, see:
 
 """
 
+from bisect import bisect_left
 from itertools import chain
 from json import JSONEncoder
-from re import finditer
+from struct import unpack_from
 from docs.a1a1 import CAPT_INFO_DB
 
 # Utilities: Formatters
@@ -40,9 +41,11 @@ def hex_to_bytes(s):
     Please group hex digits in pairs, preferably separated by spaces.
     (i.e. "ff 00 ff => \xff\x00\xff")
 
+    Whitespace, including newlines, is ignored. Any other non-hex
+    characters raise a ValueError.
+
     """
-    hexiter = finditer("[0-9a-fA-F]{2}", s)
-    return bytes(int(x.group(),16) for x in hexiter)
+    return bytes.fromhex(s)
 
 def le_16(x):
     """
@@ -50,13 +53,12 @@ def le_16(x):
 
     If a single byte sequence is given, the byte is assumed to be low,
     and the high byte is assumed to be zero (0x00). Excess bytes are
-    ignored.
+    ignored. Empty sequences raise a ValueError, as they are usually
+    fields cut off by a truncated packet.
 
     """
-    lo = x[0]
-    hi = 0x0
-    if len(x) == 2: hi = x[1]
-    return lo + (hi << 8)
+    if not x: raise ValueError('no bytes to interpret')
+    return int.from_bytes(x[:2], 'little')
 
 def le_16_hex(x):
     return "0x{v:0{l}X}".format(v=le_16(x), l=len(x)*2)
@@ -65,11 +67,7 @@ def le_16_str(x):
     return "{} ({})".format(le_16(x), le_16_hex(x))
 
 def bytes_to_hex(b):
-    out = ''
-    ints = (int(x) for x in b)
-    for c in ('{:02X} '.format(y) for y in ints if y <= 0xFF):
-        out = ''.join((out, c))
-    return out[:-1]
+    return bytes(b).hex(' ').upper()
 
 # Field Specifications
 
@@ -223,6 +221,24 @@ class CAPTPacketExporter:
     FIELDS = {
         0xA1A1: FIELDS_A1A1, # a.k.a CAPT_IDENT
     }
+    # field offsets, for finding the last field with bisect
+    FIELD_OFFSETS = {
+        op: tuple(f[1] for f in fields) for op, fields in FIELDS.items()
+    }
+    # precompiled field specs, to avoid walking FIELDS on every call
+    FIELD_SLICES = {
+        op: tuple(slice(f[1], f[1]+f[2]) for f in fields)
+        for op, fields in FIELDS.items()
+    }
+    FIELD_FNS = {
+        op: tuple(f[3] for f in fields) for op, fields in FIELDS.items()
+    }
+    FIELD_NAMES = {
+        op: tuple(f[0] for f in fields) for op, fields in FIELDS.items()
+    }
+    FIELD_LONG_NAMES = {
+        op: tuple(f[4] for f in fields) for op, fields in FIELDS.items()
+    }
 
     def __init__(self, rb):
         """
@@ -241,11 +257,12 @@ class CAPTPacketExporter:
         """
         if type(rb) is not bytes:
             raise TypeError('only byte arrays are accepted')
-        elif le_16(rb[:2]) not in self.FIELDS:
+        self._opcode = le_16(rb)
+        if self._opcode not in self.FIELDS:
             raise ValueError('unknown command in packet')
 
         self._blob = rb
-        self._fields = self.FIELDS[le_16(rb[:2])]
+        self._fields = self.FIELDS[self._opcode]
         # fields to be populated by self._setup()
         self._end_field = None # index of the first absent field
         self.reply_size = None
@@ -262,14 +279,11 @@ class CAPTPacketExporter:
         return "{}({})".format(self.__class__.__name__, self._blob)
 
     def _setup(self):
-        self.reply_size = le_16(self._blob[2:4])
+        self.reply_size, = unpack_from('<H', self._blob, 2)
         # find the last field
-        for i in range(2, len(self._fields)):
-            # TODO: replace with binary search
-            if self._fields[i][1] >= self.reply_size:
-                self._end_field = i
-                return
-        self._end_field = len(self._fields)
+        self._end_field = bisect_left(
+            self.FIELD_OFFSETS[self._opcode], self.reply_size, lo=2
+        )
 
     def _validate_fields(self):
         """
@@ -305,10 +319,13 @@ class CAPTPacketExporter:
         out = None
         k = n
         if not k: k = self._end_field
+        b = self._blob
+        slices = self.FIELD_SLICES[self._opcode][:k]
         if not fn:
-            out = (x[3](self._blob[x[1]:x[1]+x[2]]) for x in self._fields[:k])
+            fns = self.FIELD_FNS[self._opcode]
+            out = (f(b[x]) for f, x in zip(fns, slices))
         else:
-            out = (fn(self._blob[x[1]:x[1]+x[2]]) for x in self._fields[:k])
+            out = (fn(b[x]) for x in slices)
         if pad_value:
             return chain(out, (pad_value for x in range(len(self._fields)-self._end_field)))
         else: return out
@@ -342,7 +359,7 @@ class CAPTPacketExporter:
         spec, in order of appearance on the spec.
 
         """
-        return (x[0] for x in self._fields)
+        return iter(self.FIELD_NAMES[self._opcode])
 
     def long_names(self):
         """
@@ -350,13 +367,10 @@ class CAPTPacketExporter:
         spec, in order of appearance on the spec.
 
         """
-        return (x[4] for x in self._fields)
+        return iter(self.FIELD_LONG_NAMES[self._opcode])
 
     def print_info(self):
-        z = zip(
-            (x[4] for x in self._fields),
-            self.value_column_iter(fn=le_16_str)
-        )
+        z = zip(self.long_names(), self.value_column_iter(fn=le_16_str))
         for d in z:
             print("{}: {}".format(d[0], d[1]))
 
@@ -34,7 +34,18 @@
 ERR_MAX = 'lo and hi must both be 255 (0xFF) or less'
 ERR_MIN = 'lo and hi must both be zero or positive'
 
-WORD = lambda x, y: (y & 0xFF) << 8 | x & 0xFF # read 16-bit little-endian int
+def WORD(lo, hi):
+    # Read 16-bit little-endian int
+    # In C, this is best written as an inline function:
+    #
+    #   static inline uint16_t word_le(uint8_t lo, uint8_t hi)
+    #   {
+    #       return (uint16_t)hi << 8 | lo;
+    #   }
+    #
+    # When reading from a buffer, memcpy(&v, buf, 2) is also compiled to a
+    # single load, but only gives the right value on little-endian CPUs.
+    return (hi & 0xFF) << 8 | (lo & 0xFF)
 
 def BCD_le_original(lo, hi):
     # Convert little-endian 16-bit BCD to uint16_t
@@ -62,8 +73,55 @@ def BCD_le(lo, hi):
     if a > 9 or b > 9 or c > 9 or d > 9: return WORD(lo, hi)
     else: return a * 1000 + b * 100 + c * 10 + d * 1
 
+# Two-digit BCD byte values, or None if the byte is not valid BCD
+BCD_BYTE_TABLE = tuple(
+    (x >> 4) * 10 + (x & 0x0F) if (x >> 4) <= 9 and (x & 0x0F) <= 9 else None
+    for x in range(256)
+)
+
+def BCD_le_table(lo, hi):
+    # Table lookup version of BCD_le(), one lookup per byte
+    # In C, the table would be a static const int8_t[256] with -1 for
+    # invalid values, which is small enough to stay in the L1 cache
+    if lo > 0xFF or hi > 0xFF: raise ValueError(ERR_MAX)
+    if lo < 0 or hi < 0: raise ValueError(ERR_MIN)
+    h = BCD_BYTE_TABLE[hi]
+    l = BCD_BYTE_TABLE[lo]
+    if h is None or l is None: return WORD(lo, hi)
+    else: return h * 100 + l
+
+def BCD_le_packed(lo, hi):
+    # Version of BCD_le() working on the whole 16-bit word
+    # The four BCD digits already sit in four adjacent nibbles of the
+    # word, so there is no need to gather them with a PEXT-like bit
+    # extract (_pext_u32() with BMI2); a single 16-bit load does it.
+    # In C, with buf pointing to the little-endian value:
+    #
+    #   uint32_t v = buf[0] | buf[1] << 8;
+    #   if (((v + 0x6666) ^ v) & 0x11110) return v;
+    #   return (v >> 12) * 1000 + ((v >> 8) & 0xF) * 100 +
+    #       ((v >> 4) & 0xF) * 10 + (v & 0xF);
+    #
+    # All four digits are validated at once without branching: adding
+    # 6 to a nibble carries into the next nibble only when the nibble
+    # is 10 or more. The carries show up as flipped bits at bits 4, 8,
+    # 12 and 16 (bit 16 needs a type wider than uint16_t). A valid
+    # nibble next to an invalid one may carry too, but that happens only
+    # when some digit is already invalid, so the result is the same.
+    if lo > 0xFF or hi > 0xFF: raise ValueError(ERR_MAX)
+    if lo < 0 or hi < 0: raise ValueError(ERR_MIN)
+    v = WORD(lo, hi)
+    if ((v + 0x6666) ^ v) & 0x11110: return v
+    else:
+        return (v >> 12)*1000 + ((v >> 8) & 0xF)*100 + ((v >> 4) & 0xF)*10 \
+            + (v & 0xF)
+
 def BCD_le_test():
     assert(BCD_le(0x02, 0x00) == 2)
     assert(BCD_le(0x99, 0x99) == 9999)
     assert(BCD_le(0x02, 0xEF) == 0xEF02)
     assert(BCD_le(0xEF, 0x02) == 0x02EF)
+    for lo in range(256):
+        for hi in range(256):
+            assert(BCD_le_table(lo, hi) == BCD_le(lo, hi))
+            assert(BCD_le_packed(lo, hi) == BCD_le(lo, hi))
@@ -41,13 +41,16 @@ easily to compact and complex C for-loop logic.
 # See the License for the specific language governing permissions and
 # limitations under the License. 
 
-from timeit import timeit
+from timeit import Timer
 from secrets import randbelow
 
+# Upper limits of common uint sizes, to avoid working them out on every call
+GUARD_MAX = {1: 1<<8, 2: 1<<16, 4: 1<<32, 8: 1<<64}
+
 def guard_val(val, sizeof):
     if(val < 0):
         raise ValueError('sorry, uints only')
-    elif val >= 2**(8*sizeof) or val < 0:
+    elif val >= (GUARD_MAX.get(sizeof) or 1 << (8*sizeof)):
         raise ValueError(f"sorry, {8*sizeof}-bit uints only")
 
 def find_msb(val, sizeof=4):
@@ -190,6 +193,123 @@ def find_msb_bisect_right(val, sizeof=4):
             nbmin = nbmid + 1
     return nbmin
 
+def find_msb_clz(val, sizeof=4):
+    """
+    find_msb() using the count-leading-zeroes instruction found on
+    most CPUs, which Python exposes through int.bit_length().
+
+    This is the only version without a loop, but it relies on a
+    compiler builtin in C. Possible C version:
+
+    static unsigned int find_msb(uint32_t val)
+    {
+    #if defined(__GNUC__)
+        return val ? 32 - __builtin_clz(val) : 0; /* GCC & Clang */
+    #else
+        unsigned long i;          /* MSVC: #include <intrin.h> */
+        return _BitScanReverse(&i, val) ? i + 1 : 0;
+    #endif
+    }
+
+    Use __builtin_clzll() or _BitScanReverse64() for 64-bit values.
+    __builtin_clz(0) is undefined, hence the check for zero.
+
+    """
+    guard_val(val, sizeof)
+    return val.bit_length()
+
+# Lookup table for find_msb_mod67(): after the bits below the MSB are
+# smeared, val is always (1<<n)-1, and (1<<n)-1 gives a unique
+# remainder when divided by 67 for all n from 0 to 64, because 2 is a
+# primitive root of 67. Unused entries are left as 0xFF.
+MSB_MOD67_TABLE = [0xFF,] * 67
+_n = 0
+while _n <= 64:
+    MSB_MOD67_TABLE[((1 << _n) - 1) % 67] = _n
+    _n += 1
+
+def find_msb_mod67(val, sizeof=4):
+    """
+    Branchless find_msb() for 64-bit values or smaller: smear the MSB
+    over all lower bits, then look up the bit length by the remainder
+    of the result divided by 67.
+
+    This is a variant of the De Bruijn multiplication trick that swaps
+    the multiplication for a modulo, and is suitable for CPUs without
+    a count-leading-zeroes instruction. Possible C version:
+
+    static unsigned int find_msb(uint64_t val)
+    {
+        static const uint8_t table[67] = {...}; /* MSB_MOD67_TABLE */
+        val |= val >> 1;
+        val |= val >> 2;
+        val |= val >> 4;
+        val |= val >> 8;
+        val |= val >> 16;
+        val |= val >> 32;
+        return table[val % 67];
+    }
+
+    Drop the >> 32 step for 32-bit values.
+
+    See also: "Count the consecutive zero bits (trailing) on the right
+    with modulus division and lookup" in Bit Twiddling Hacks by Sean
+    Eron Anderson <https://graphics.stanford.edu/~seander/bithacks.html>
+
+    """
+    if sizeof > 8: raise ValueError('sorry, 64-bit uints or smaller only')
+    guard_val(val, sizeof)
+    val |= val >> 1
+    val |= val >> 2
+    val |= val >> 4
+    val |= val >> 8
+    val |= val >> 16
+    val |= val >> 32
+    return MSB_MOD67_TABLE[val % 67]
+
+def find_msb_popcount(val, sizeof=4):
+    """
+    Branchless find_msb() for 64-bit values or smaller: smear the MSB
+    over all lower bits, then count the set bits with the parallel
+    ("SWAR") population count.
+
+    Unlike find_msb_mod67(), this needs no table and no division, and
+    maps directly to vector instructions when run over arrays of
+    values. Possible C version:
+
+    static unsigned int find_msb(uint64_t val)
+    {
+        val |= val >> 1;
+        val |= val >> 2;
+        val |= val >> 4;
+        val |= val >> 8;
+        val |= val >> 16;
+        val |= val >> 32;
+        val -= (val >> 1) & 0x5555555555555555;
+        val = (val & 0x3333333333333333) + ((val >> 2) & 0x3333333333333333);
+        val = (val + (val >> 4)) & 0x0F0F0F0F0F0F0F0F;
+        return (val * 0x0101010101010101) >> 56;
+    }
+
+    For 32-bit values, drop the >> 32 step, cut the constants down to
+    32 bits (0x55555555, 0x33333333, 0x0F0F0F0F, 0x01010101) and shift
+    the result right by 24 instead.
+
+    """
+    if sizeof > 8: raise ValueError('sorry, 64-bit uints or smaller only')
+    guard_val(val, sizeof)
+    val |= val >> 1
+    val |= val >> 2
+    val |= val >> 4
+    val |= val >> 8
+    val |= val >> 16
+    val |= val >> 32
+    val -= (val >> 1) & 0x5555555555555555
+    val = (val & 0x3333333333333333) + ((val >> 2) & 0x3333333333333333)
+    val = (val + (val >> 4)) & 0x0F0F0F0F0F0F0F0F
+    return ((val * 0x0101010101010101) & 0xFFFFFFFFFFFFFFFF) >> 56
+        # the mask emulates overflow of a C uint64_t
+
 # Benchmarking stuff
 #
 SAMPLE_SIZE = 100000
@@ -203,7 +323,10 @@ funcs = (
     find_msb_shortcut_quadchoice,
     find_msb_twoway,
     find_msb_bisearch,
-    find_msb_bisect_right
+    find_msb_bisect_right,
+    find_msb_clz,
+    find_msb_mod67,
+    find_msb_popcount,
 )
 
 def benchmark(funcs=funcs, sample=sample_32, number=1, sizeof=4):
@@ -216,8 +339,8 @@ def benchmark(funcs=funcs, sample=sample_32, number=1, sizeof=4):
     # Benchmark defaults to using cached random 32-bit numbers
     out = []
     for f in funcs:
-        stmt = f"[f(i, sizeof={sizeof}) for i in sample]"
-        score = timeit(stmt, number=number, globals=locals())
+        timer = Timer(lambda f=f: [f(i, sizeof=sizeof) for i in sample])
+        score = timer.timeit(number=number)
         out.append((f, score))
     return out
 
@@ -33,13 +33,15 @@ testing any other printer driver.
 # TODO: Re-implement using XML API (xml.etree)
 
 from argparse import ArgumentParser
-from math import log2
-from sys import argv, stderr
+from functools import lru_cache
+from io import StringIO
+from itertools import cycle, repeat
+from sys import argv, stderr, stdout
 
 # See below for the other constants
 UNIT_DEFAULT = 'mm'
 
-q = lambda s, unit: "{}{}".format(s,unit) # quantity with unit as string
+q = lambda s, unit: f"{s}{unit}" # quantity with unit as string
 svg_s = lambda w,h,cont: SVG_FMT.format(w, h, XMLNS_SVG, XMLNS_XLINK, cont)
     # build SVG section
 
@@ -55,10 +57,8 @@ def _ball_symbol(rw, r_h, unit=UNIT_DEFAULT):
     qy_c = q(r_h/2, unit)
     qrx = q(rw/2.03125, unit)
     qry = q(r_h/2.03125, unit)
-    ellipse = "<ellipse cx='{}' cy='{}' rx='{}' ry='{}' />".format(
-        qx_c, qy_c, qrx, qry
-    )
-    symbol = "<symbol id='{}'>\n{}\n</symbol>".format(BALL_ID, ellipse)
+    ellipse = f"<ellipse cx='{qx_c}' cy='{qy_c}' rx='{qrx}' ry='{qry}' />"
+    symbol = f"<symbol id='{BALL_ID}'>\n{ellipse}\n</symbol>"
     return symbol
 
 def _rad_gradient_def(stop_list, rg_id=0):
@@ -70,12 +70,10 @@ def _rad_gradient_def(stop_list, rg_id=0):
     stop is an int/float percentage, color is an RGB hex string
 
     """
-    rg_fmt = "<radialGradient id='rg-{}'>{}</radialGradient>"
-    stop_fmt = "<stop offset='{}%' stop-color='#{}' />"
-    stop_cnt = ''
-    for s in stop_list:
-        stop_cnt = ''.join((stop_cnt, stop_fmt.format(s[0], s[1]),))
-    return rg_fmt.format(rg_id, stop_cnt)
+    stop_cnt = ''.join(
+        f"<stop offset='{s[0]}%' stop-color='#{s[1]}' />" for s in stop_list
+    )
+    return f"<radialGradient id='rg-{rg_id}'>{stop_cnt}</radialGradient>"
 
 def _ball(x, y, fill, unit=UNIT_DEFAULT, u_id=None):
     """
@@ -95,12 +93,10 @@ def _ball(x, y, fill, unit=UNIT_DEFAULT, u_id=None):
     """
     idp = ''
     if u_id is not None:
-        idp = ''.join(("id='{0}'".format(u_id), ' ',))
+        idp = f"id='{u_id}' "
     qx_r = q(x, unit)
     qy_r = q(y, unit)
-    use = "<use {}x='{}' y='{}' fill='{}' xlink:href='#ball'/>".format(
-        idp, qx_r, qy_r, fill
-    )
+    use = f"<use {idp}x='{qx_r}' y='{qy_r}' fill='{fill}' xlink:href='#ball'/>"
     return use
 
 def _black_flat_ball(x, y, unit=UNIT_DEFAULT, u_id=None, i=0):
@@ -113,7 +109,8 @@ def _black_flat_ball(x, y, unit=UNIT_DEFAULT, u_id=None, i=0):
     _ball() above for usage.
 
     """
-    return _ball(x, y, '#000', unit=unit, u_id=u_id)
+    fill, = MODES_FILLS['black']
+    return _ball(x, y, fill, unit=unit, u_id=u_id)
 
 def _grey_flat_ball(x, y, unit=UNIT_DEFAULT, u_id=None, i=0):
     """
@@ -125,7 +122,8 @@ def _grey_flat_ball(x, y, unit=UNIT_DEFAULT, u_id=None, i=0):
     _ball() above for usage.
 
     """
-    return _ball(x, y, '#bbb', unit=unit, u_id=u_id)
+    fill, = MODES_FILLS['grey']
+    return _ball(x, y, fill, unit=unit, u_id=u_id)
 
 def _color_flat_ball(x, y, unit=UNIT_DEFAULT, u_id=None, i=0):
     """
@@ -140,7 +138,7 @@ def _color_flat_ball(x, y, unit=UNIT_DEFAULT, u_id=None, i=0):
     _ball() above for usage.
 
     """
-    fills = ('#0ff', '#f0f', '#ff0', '#000', '#f00', '#0f0', '#00f') # CMYKRGB
+    fills = MODES_FILLS['color']
     k = i % len(fills)
     return _ball(x, y, fills[k], unit=unit, u_id=u_id)
 
@@ -159,11 +157,23 @@ def _gradi_ball(x, y, unit=UNIT_DEFAULT, u_id=None, i=0):
     _ball() above for usage.
 
     """
-    k = i % 2
-    fill_url = "url(#rg-{})".format(k)
-    return _ball(x, y, fill_url, unit=unit, u_id=u_id)
+    fills = MODES_FILLS['bw-radial-gradient']
+    k = i % len(fills)
+    return _ball(x, y, fills[k], unit=unit, u_id=u_id)
 
-def balls_page(m, w, h, unit=UNIT_DEFAULT, mode='grey'):
+@lru_cache(maxsize=32)
+def _coords(m, w, h, unit=UNIT_DEFAULT):
+    """
+    Return a tuple (xs, ys) of the x and y positions of m x m Balls on
+    a page of size w x h, as strings with units. The positions are
+    remembered, as pages of the same size are often requested again.
+
+    """
+    xs = tuple(q(ix * (w/m), unit) for ix in range(m))
+    ys = tuple(q(iy * (h/m), unit) for iy in range(m))
+    return (xs, ys)
+
+def balls_page(m, w, h, unit=UNIT_DEFAULT, mode='grey', emit_ids=False):
     """
     Returns a string for a one-page SVG document containing m x m
     Balls.
@@ -179,6 +189,10 @@ def balls_page(m, w, h, unit=UNIT_DEFAULT, mode='grey'):
     * mode: selects shading on the Balls. See the MODES_FNS dict near the
       bottom of this module for a list of all possible choices.
 
+    * emit_ids: give each Ball a unique XML id (ball-0, ball-1 and so
+      on). The ids are not referenced in the document, and are omitted
+      by default to keep the document smaller.
+
     Example Usage
     =============
     >>> balls_page(8, 210, 297, unit="mm" mode="grey")
@@ -187,48 +201,85 @@ def balls_page(m, w, h, unit=UNIT_DEFAULT, mode='grey'):
     >>> balls_page(4, 8, 11, unit="in" mode="color")
     # generates a US Letter-sized page with 16 coloured balls
 
+    """
+    out = StringIO()
+    balls_page_stream(m, w, h, out, unit=unit, mode=mode, emit_ids=emit_ids)
+    return out.getvalue()
+
+def balls_page_stream(
+        m, w, h, out, unit=UNIT_DEFAULT, mode='grey', encoding=None,
+        emit_ids=False
+    ):
+    """
+    Write a one-page SVG document containing m x m Balls to the
+    text stream ``out``, one row of Balls at a time.
+
+    If ``encoding`` is set, ``out`` is treated as a binary stream, and
+    the document is encoded as it is written, row by row.
+
+    The other arguments have the same use as in balls_page(), see
+    balls_page() above for usage.
+
+    Example Usage
+    =============
+    >>> with open('balls.svg', mode='x') as f:
+    ...     balls_page_stream(64, 210, 297, f, unit="mm", mode="color")
+    # writes an A4-sized page with 64x64 coloured balls to balls.svg
+
     """
     if mode not in MODES_FNS:
         choices = tuple(MODES_FNS.keys())
         raise ValueError('mode: please select from {}'.format(choices))
-    fn = MODES_FNS[mode]
-    if log2(m) % 1 != 0:
+    fills = MODES_FILLS[mode]
+    if m <= 0 or m & (m-1):
         raise ValueError('m, number of balls per row, must be power of two')
     desc_text = DESC_TEXT_FMT.format(n=m, shading=mode)
     desc = DESC_FMT.format(desc_text)
     # prepare defs
     defs_list = [_ball_symbol(w/m, h/m, unit=unit),]
     defs_list.extend(GRAD_DEFS[mode])
-    defs_cnt = ''
-    for d in defs_list:
-        defs_cnt = ''.join((defs_cnt, d, '\n'))
+    defs_cnt = ''.join(f"{d}\n" for d in defs_list)
     defs = DEFS_FMT.format(defs_cnt)
-    # prepare content
-    cont = ''
-    c_total = 0
-    for iy in range(m):
-        y = iy * (h/m)
-        for ix in range(m):
-            x = ix * (w/m)
-            u_id = "ball-{}".format(c_total)
-            cont = ''.join((cont, fn(x,y,unit=unit,u_id=u_id,i=c_total), '\n'))
-            c_total += 1
-    cont = ''.join((desc, defs, cont))
-    # prepare and return final SVG code
+    # write headers
+    if encoding:
+        write = lambda x: out.write(x.encode(encoding))
+    else:
+        write = out.write
     dw = q(w, unit)
     dh = q(h, unit)
-    svg = svg_s(dw, dh, cont)
-    page = ''.join((DOCTYPE, '\n', svg))
-    return page
+    write(''.join((DOCTYPE, '\n')))
+    write(SVG_HEAD_FMT.format(dw, dh, XMLNS_SVG, XMLNS_XLINK))
+    write(desc)
+    write(defs)
+    # write content
+    # PROTIP: the Balls are laid out on a grid, so the positions only
+    # need to be worked out once per row and column. This loop puts out
+    # the same <use> elements as the functions in MODES_FNS.
+    xs, ys = _coords(m, w, h, unit)
+    ids = repeat('')
+    fill_iter = cycle(fills)
+    for iy, qy in enumerate(ys):
+        if emit_ids: ids = [f"id='ball-{k}' " for k in range(iy*m, iy*m+m)]
+        # PROTIP: xs goes first, so that zip() stops before taking an
+        # extra fill at the end of each row
+        write(''.join([
+            f"<use {idp}x='{qx}' y='{qy}' fill='{fill}' xlink:href='#ball'/>\n"
+            for qx, idp, fill in zip(xs, ids, fill_iter)
+        ]))
+    write(SVG_TAIL)
 
 def print_preset_page(size_name, m, mode='grey'):
     # execute command line call
     if size_name in SIZES:
         a = SIZES[size_name]
-        print(balls_page(int(m), a[0], a[1], unit=a[2], mode=mode))
+        balls_page_stream(
+            int(m), a[0], a[1], stdout.buffer, unit=a[2], mode=mode,
+            encoding='utf-8'
+        )
+        stdout.buffer.write(b'\n')
     else:
         msg = "SIZE_NAME must be one of the following: {}".format(
-            tuple(sizes.keys())
+            tuple(SIZES.keys())
         )
         print(msg, file=stderr)
 
@@ -247,8 +298,9 @@ SIZES = {
 XMLNS_SVG = 'http://www.w3.org/2000/svg'
 XMLNS_XLINK = 'http://www.w3.org/1999/xlink'
 
-SVG_FMT = "<svg width='{}' height='{}' xmlns='{}' xmlns:xlink='{}'>\n" + \
-    "{}</svg>"
+SVG_HEAD_FMT = "<svg width='{}' height='{}' xmlns='{}' xmlns:xlink='{}'>\n"
+SVG_TAIL = "</svg>"
+SVG_FMT = SVG_HEAD_FMT + "{}" + SVG_TAIL
 DEFS_FMT = "<defs>\n{}</defs>\n"
 DESC_TEXT_FMT = "An orderly arrangement of {n} by {n} {shading} balls"
 DESC_FMT = "<desc>{}</desc>\n"
@@ -262,7 +314,7 @@ GRAD_RB_A = (
     (80, "ff0"),
     (100, "f00"),
 )
-GRAD_RB_B = (
+GRAD_RB_B = tuple(
     (GRAD_RB_A[x][0], GRAD_RB_A[-(x+1)][1]) for x in range(len(GRAD_RB_A))
 ) # take rb_a, keep the stops, reverse the order of the colours
 
@@ -284,6 +336,19 @@ GRAD_DEFS = {
     'color-radial-gradient': COLOR_GRAD_DEFS,
     'colour-radial-gradient': COLOR_GRAD_DEFS,
 }
+COLOR_FILLS = ('#0ff', '#f0f', '#ff0', '#000', '#f00', '#0f0', '#00f') # CMYKRGB
+GRAD_FILLS = ('url(#rg-0)', 'url(#rg-1)')
+MODES_FILLS = {
+    # fills to cycle through, see the functions in MODES_FNS
+    'black': ('#000',),
+    'grey': ('#bbb',),
+    'gray': ('#bbb',),
+    'color': COLOR_FILLS,
+    'colour': COLOR_FILLS,
+    'bw-radial-gradient': GRAD_FILLS,
+    'color-radial-gradient': GRAD_FILLS,
+    'colour-radial-gradient': GRAD_FILLS,
+}
 MODES_FNS = {
     'black': _black_flat_ball,
     'grey': _grey_flat_ball,
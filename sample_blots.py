@@ -2,7 +2,8 @@
 """
 RLE Test Page Generator
 Create rasters with funky patterns for studying run-length encoding (RLE)
-techniques. Rasters may be output in PBM (P4) or PGM (P5) format.
+techniques. Rasters may be output in PBM (P4) or PGM (P5) format, or as
+SCoA-compressed P4 bitmaps.
 
 The original purpose of this module was to reverse-engineer the Smart
 Compression Architecture (SCoA) format primarily used by early-2000s and
@@ -35,10 +36,13 @@ late-1990s Canon laser printers.
 #
 from argparse import ArgumentParser
 from collections import OrderedDict
-from itertools import chain
+from functools import lru_cache
+from itertools import islice, repeat
+from math import ceil, floor, isqrt
 from os.path import expanduser
 from sys import argv, stdout
 from blob_pic import BlobPic
+from scoa import SCoAEncoder
 
 TITLE = "Studycapt RLE Study"
 HEADER_FMT = "{}\n# Studycapt RLE Study\n# {}\n{} {}\n"
@@ -48,6 +52,8 @@ P4_MIN_VALUE = 127
 P5_MAX_VALUE = 255
 INDEX_ERROR_FMT = "index {} out of bounds"
 SQUARE_SIZE_DEFAULT = 64
+SCOA_HEADER_FMT = "SCOA\n{} {}\n{}\n"
+SCOA_INIT_VALUE = b'\xf0' # same as scoa.scoa_file_to_p4()
 
 # Plotting & Blotting Functions
 
@@ -99,6 +105,42 @@ SQUARE_SIZE_DEFAULT = 64
 # 0x00FF00 and primary blue is 0x0000FF.
 #
 
+def _row_spans(w, i, n):
+    """
+    Split the n pixels following pixel i of a raster w pixels wide into
+    spans that do not cross rows. Yield each span as a tuple (y, x0, x1),
+    where y is the row and x0 and x1 are the start and end columns of
+    the span, with x1 being exclusive.
+
+    This allows plotting functions to work out per-row values only once
+    per row, instead of once per pixel.
+
+    """
+    y, x0 = divmod(i, w)
+    while n > 0:
+        x1 = min(w, x0+n)
+        yield (y, x0, x1)
+        n -= x1 - x0
+        y += 1
+        x0 = 0
+
+def _grated_run(x0, x1, gx, v):
+    """
+    Yield a run of pixels of value v from column x0 up to, but not
+    including, column x1, with every pixel in a column that is a
+    multiple of gx cleared.
+
+    """
+    x = x0
+    while x < x1:
+        if not x%gx:
+            yield 0x00
+            x += 1
+            continue
+        x_next = min(x1, (x//gx + 1) * gx)
+        yield from repeat(v, x_next-x)
+        x = x_next
+
 def _mk_fn_all_clear(w, h, **kwargs):
     """Create a function that yields pixels for a blank page"""
 
@@ -123,6 +165,7 @@ def _mk_fn_all_set(w, h, **kwargs):
         if i + n > n_px: raise ValueError(INDEX_ERROR_FMT.format(i+n))
         return (v for x in range(n))
 
+    _fn_all_set.row_value = lambda y: v # see _p4_rows()
     return _fn_all_set
 
 def _mk_fn_checkerboard(w, h, **kwargs):
@@ -139,16 +182,15 @@ def _mk_fn_checkerboard(w, h, **kwargs):
 
     def _fn_checkerboard(i, n):
         if i + n > img_w * img_h: raise ValueError(INDEX_ERROR_FMT.format(i+n))
-        for j in range(n):
-            i_px = i+j
-            y = i_px // img_w
-            x = i_px % img_w
-            odd_row = (y // ssz) & 0x01
-            odd_col = (x // ssz) & 0x01
-            if ((odd_row and odd_col) or (not odd_row and not odd_col))\
-               and (x%gx and y%gy)\
-               and x > mleft: yield v
-            else: yield 0x0
+        for y, x0, x1 in _row_spans(img_w, i, n):
+            if not y%gy:
+                yield from repeat(0x0, x1-x0)
+                continue
+            odd_row = (y // ssz) & 0x01 # constant for the whole row
+            for x in range(x0, x1):
+                odd_col = (x // ssz) & 0x01
+                if odd_row == odd_col and x%gx and x > mleft: yield v
+                else: yield 0x0
 
     return _fn_checkerboard
 
@@ -187,12 +229,24 @@ def _mk_fn_incr_runs_2_pow_x(w, h, **kwargs):
 
     def _fn_incr_runs_2_pow_x(i, n):
         if i + n > img_w * img_h: raise ValueError(INDEX_ERROR_FMT.format(i+n))
-        for x in range(n):
-            i_px = i + x - (mt * img_w)
-            b = 2**(i_px.bit_length()-1) # bias
-            run_ord = i_px - b # pixel position in run
-            if run_ord >= b//2: yield v
-            else: yield 0x0
+        # PROTIP: runs start at powers of two, counting from the top
+        # margin. For every power of two b, pixels b to b + b//2 - 1 are
+        # clear, and pixels b + b//2 to 2b - 1 are set. The pixels are
+        # put out a whole run at a time, instead of being tested one
+        # at a time.
+        i_px = i - (mt * img_w)
+        end = i_px + n
+        if i_px < 1: # nothing is set above the first run
+            stop = min(1, end)
+            yield from repeat(0x0, stop-i_px)
+            i_px = stop
+        while i_px < end:
+            b = 1 << (i_px.bit_length()-1) # bias
+            if i_px < b + b//2: stop, val = b + b//2, 0x0
+            else: stop, val = 2*b, v
+            stop = min(stop, end)
+            yield from repeat(val, stop-i_px)
+            i_px = stop
 
     return _fn_incr_runs_2_pow_x
 
@@ -204,12 +258,12 @@ def _mk_fn_incr_runs(w, h, **kwargs):
     def _fn_incr_runs(i, n):
         if i + n > img_w * img_h: raise ValueError(INDEX_ERROR_FMT.format(i+n))
 
-        for x in range(n):
-            i_px = i + x
-            y = i_px/img_w
-            x = i_px%img_w
-            if x%(y or 1) >= y//2: yield v
-            else: yield 0x00
+        for row, x0, x1 in _row_spans(img_w, i, n):
+            i_row = row * img_w
+            for x in range(x0, x1):
+                y = (i_row + x)/img_w
+                if x%(y or 1) >= y//2: yield v
+                else: yield 0x00
 
     return _fn_incr_runs
 
@@ -218,24 +272,35 @@ def _mk_fn_circle(w, h, **kwargs):
     Create a function that yields pixels for a page with a single circle
     in the middle.
     """
-    r_sq = (min(w,h)/2.5)**2 # radius is based off w or h, whichever is smaller
+    # PROTIP: distances from the centre are doubled, so that the circle
+    # can be tested with integers only; a pixel is in the circle when
+    # (2x-w)**2 + (2y-h)**2 <= (2r)**2, and with r == min(w,h)/2.5,
+    # (2r)**2 == 16 * min(w,h)**2 / 25, rounded down as the left side
+    # is always an integer.
+    d2_sq_max = (16 * min(w,h)**2) // 25 # radius is based off w or h
     v = kwargs.get('value', PX_VALUE_DEFAULT)
     gx = kwargs.get('grate_x', w+1)
     gy = kwargs.get('grate_y', h+1)
     img_w = w
     img_h = h
     n_px = h * w
-    half_img_w = w/2
-    half_img_h = h/2
 
     def _fn_circle(i, n):
         if i + n > n_px: raise ValueError(INDEX_ERROR_FMT.format(i+n))
-        for j in range(n):
-            y = (i+j) // img_w
-            x = (i+j) % img_w
-            if (x-half_img_w)**2 + (y-half_img_h)**2 <= r_sq and x%gx and y%gy:
-                yield v
-            else: yield 0x00
+        for y, x0, x1 in _row_spans(img_w, i, n):
+            dy2 = 2*y - img_h # constant for the whole row
+            dx2_sq_max = d2_sq_max - dy2*dy2
+            if not y%gy or dx2_sq_max < 0: # grated, above or below circle
+                yield from repeat(0x00, x1-x0)
+                continue
+            # PROTIP: the pixels inside the circle form a single span
+            # on every row, where abs(2x-w) <= isqrt(dx2_sq_max)
+            dx2 = isqrt(dx2_sq_max)
+            lo = min(max(x0, -((dx2-img_w) // 2)), x1)
+            hi = max(lo, min(x1, (img_w+dx2)//2 + 1)) # exclusive
+            yield from repeat(0x00, lo-x0)
+            yield from _grated_run(lo, hi, gx, v)
+            yield from repeat(0x00, x1-hi)
 
     return _fn_circle
 
@@ -262,14 +327,31 @@ def _mk_fn_half_diagonal(w, h, **kwargs):
 
     def _fn_half_diagonal(i, n):
         if i + n > img_w * img_h: raise ValueError(INDEX_ERROR_FMT.format(i+n))
-        for x in range(n):
-            i_px = i + x
-            x = i_px % img_w
-            y = i_px // img_w
-            if x > mleft and y >= (m * (x-mleft)) + c and x%gx and y%gy:
-                yield v
+        for y, x0, x1 in _row_spans(img_w, i, n):
+            if not y%gy:
+                yield from repeat(0x00, x1-x0)
+                continue
             # PROTIP: threshold line eq. is y == m * x + c
-            else: yield 0x00
+            # The shaded pixels right of the margin form a single span on
+            # every row: up to the line when m > 0, and from the line
+            # onwards when m < 0. Find the span, then fill it as a run.
+            below = lambda x: y >= (m * (x-mleft)) + c
+            lo = min(max(x0, mleft+1), x1)
+            hi = x1
+            if m > 0:
+                hi = min(max(lo, floor((y-c)/m) + mleft + 1), x1)
+                while hi < x1 and below(hi): hi += 1
+                while hi > lo and not below(hi-1): hi -= 1
+            elif m < 0:
+                lo_x = lo
+                lo = min(max(lo_x, ceil((y-c)/m) + mleft), x1)
+                while lo > lo_x and below(lo-1): lo -= 1
+                while lo < hi and not below(lo): lo += 1
+            elif not below(lo):
+                hi = lo
+            yield from repeat(0x00, lo-x0)
+            yield from _grated_run(lo, hi, gx, v)
+            yield from repeat(0x00, x1-hi)
 
     return _fn_half_diagonal
 
@@ -292,14 +374,15 @@ def _mk_fn_half_horizontal(w, h, **kwargs):
     img_w = w
     img_h = h
     v = kwargs.get('value', PX_VALUE_DEFAULT)
+    i_half = (h//2) * w # first pixel of the shaded half
 
     def _fn_half_horizontal(i, n):
         if i + n > img_w * img_h: raise ValueError(INDEX_ERROR_FMT.format(i+n))
-        for x in range(n):
-            i_px = i + x
-            if i_px/img_w >= img_h//2: yield v
-            else: yield 0x00
+        n_clear = min(max(i_half-i, 0), n)
+        yield from repeat(0x00, n_clear)
+        yield from repeat(v, n-n_clear)
 
+    _fn_half_horizontal.row_value = lambda y: v if y >= img_h//2 else 0x00
     return _fn_half_horizontal
 
 def _mk_fn_mirrored_incr_runs(w, h, **kwargs):
@@ -310,13 +393,13 @@ def _mk_fn_mirrored_incr_runs(w, h, **kwargs):
 
     def _fn_mirrored_incr_runs(i, n):
         if i + n > img_w * img_h: raise ValueError(INDEX_ERROR_FMT.format(i+n))
-        for x in range(n):
-            i_px = i + x
-            x = i_px % img_w
-            y = i_px // img_w
+        for y, x0, x1 in _row_spans(img_w, i, n):
             k = y - half_img_h
-            if x%(k or 1) >= k//2: yield v
-            else: yield 0x00
+            k_mod = k or 1
+            k_half = k//2
+            for x in range(x0, x1):
+                if x%k_mod >= k_half: yield v
+                else: yield 0x00
 
     return _fn_mirrored_incr_runs
 
@@ -337,21 +420,18 @@ def _mk_fn_quarter_diagonal(w, h, **kwargs):
 def _get_p5_raster(w, h, fn, comment=''):
     """
     Generate PGM P5 raster w pixels wide, h pixels tall, using pixel
-    function fn. Return raster as an iter.
+    function fn. Return raster as a bytearray.
 
     """
     h_maxg = '{} {}'.format(h, P5_MAX_VALUE) # height and max grey value in one
-    header = bytes(
-        HEADER_FMT.format('P5', comment, w, h_maxg), encoding='ascii'
-    )
-    body = bytes(P5_MAX_VALUE-x for x in fn(0, (w*h)-1))
-    raster = chain(header, body)
-    return (x for x in raster)
+    raster = bytearray(HEADER_FMT.format('P5', comment, w, h_maxg), 'ascii')
+    raster += bytes(P5_MAX_VALUE-x for x in fn(0, (w*h)-1))
+    return raster
 
 def _get_p4_raster(w, h, fn, comment=''):
     """
     Generate PBM P4 raster w pixels wide, h pixels tall, using pixel
-    function fn. Return the raster as an iter.
+    function fn. Return the raster as a bytearray.
 
     Any pixel of value 127 and above will be set.
 
@@ -359,39 +439,129 @@ def _get_p4_raster(w, h, fn, comment=''):
     header = bytes(
         HEADER_FMT.format('P4', comment, w, h), encoding='ascii'
     )
-    rows = (_p4_get_row(w, fn(x, w), P4_MIN_VALUE) for x in range(0,w*h, w))
-    body = chain.from_iterable(r for r in rows)
-    raster = chain(header, body)
-    return (x for x in raster)
+    return _p4_body(w, h, fn, header=header)
+
+def _write_p4_raster(out, w, h, fn, comment=''):
+    """
+    Write a PBM P4 raster w pixels wide, h pixels tall, using pixel
+    function fn, to the binary stream 'out' one row at a time.
+
+    Unlike _get_p4_raster(), the whole raster is never held in memory.
+
+    """
+    out.write(bytes(HEADER_FMT.format('P4', comment, w, h), encoding='ascii'))
+    for row in _p4_rows(w, h, fn):
+        out.write(row)
+
+def _write_p5_raster(out, w, h, fn, comment=''):
+    """
+    Write a PGM P5 raster w pixels wide, h pixels tall, using pixel
+    function fn, to the binary stream 'out'.
+
+    """
+    out.write(_get_p5_raster(w, h, fn, comment))
+
+def _get_scoa_raster(w, h, fn, comment=''):
+    """
+    Generate a Studycapt SCoA-compressed P4 bitmap w pixels wide, h
+    pixels tall, using pixel function fn. Return the file as a
+    bytearray. The file format is described in scoa.scoa_file_to_p4().
+
+    Comments are not supported by the format, and are ignored.
+
+    """
+    n_row = -(-w // PIXELS_PER_BYTE)
+    encoder = SCoAEncoder(n_row, init_value=SCOA_INIT_VALUE)
+    data = b''.join(encoder.encode(_p4_rows(w, h, fn)))
+    out = bytearray(SCOA_HEADER_FMT.format(w, h, len(data)), 'ascii')
+    out += data
+    return out
+
+def _write_scoa_raster(out, w, h, fn, comment=''):
+    """
+    Write a Studycapt SCoA-compressed P4 bitmap w pixels wide, h pixels
+    tall, using pixel function fn, to the binary stream 'out'.
+
+    The compressed data is held in memory until it is complete, as its
+    length must be written into the header.
+
+    """
+    out.write(_get_scoa_raster(w, h, fn, comment))
 
 def _get_bmp_raster(w, h, fn, **kwargs):
     # comments are not supported
-    rows = (_p4_get_row(w, fn(x, w), P4_MIN_VALUE) for x in range(0,w*h, w))
-    body = bytes(chain.from_iterable(r for r in rows))
-    return (x for x in BlobPic(w, h, body, bpp=1).bmp())
+    return BlobPic(w, h, _p4_body(w, h, fn), bpp=1).bmp()
+
+def _p4_body(w, h, fn, header=b''):
+    """
+    Return a bytearray of 'header' followed by the packed P4 rows of a
+    raster w pixels wide, h pixels tall, using pixel function fn.
+
+    The whole raster is allocated up front and filled in row by row.
+
+    """
+    n_row = -(-w // PIXELS_PER_BYTE)
+    n_head = len(header)
+    out = bytearray(n_head + n_row*h)
+    out[:n_head] = header
+    i = n_head
+    for row in _p4_rows(w, h, fn):
+        out[i:i+n_row] = row
+        i += n_row
+    return out
+
+def _p4_rows(w, h, fn):
+    """
+    Yield the packed P4 rows of a raster w pixels wide, h pixels tall,
+    using pixel function fn, one row at a time.
+
+    If fn has a 'row_value' attribute, every pixel in row y is assumed
+    to have the value fn.row_value(y). Each distinct row is then packed
+    only once, and repeated wherever it appears again.
+
+    """
+    row_value = getattr(fn, 'row_value', None)
+    if row_value is not None:
+        rows = {}
+        for y in range(h):
+            v = row_value(y)
+            if v not in rows:
+                rows[v] = _p4_get_row(w, repeat(v, w), P4_MIN_VALUE)
+            yield rows[v]
+        return
+    for x in range(0, w*h, w):
+        yield _p4_get_row(w, fn(x, w), P4_MIN_VALUE)
+
+@lru_cache
+def _p4_bits_table(t):
+    """
+    Return a bytes.translate() table that maps pixel values to ASCII
+    '1' if they are 't' and above, and '0' otherwise.
+
+    """
+    return bytes(b'1'[0] if x >= t else b'0'[0] for x in range(256))
 
 def _p4_get_row(w, v, t):
     """
     Format a row of pixel values 'v' for a P4 raster 'w' pixels wide.
     Any pixel of value 't' and above will be set.
 
-    Pixels are returned as a row of packed ints (8-bit int where each
-    bit represents one pixel).
+    Pixels are returned as a row of packed ints in a bytes object (8-bit
+    int where each bit represents one pixel).
 
     """
-    out = 0x0
-    mask = 0x80
-    i = 0
-    for val in v:
-        if val >= t: out |= mask
-        mask >>= 1
-        i += 1
-        if not mask:
-            yield out
-            out = 0x0 # PROTIP: fn starts here on next call
-            mask = 0x80
-            # See: https://docs.python.org/3/tutorial/classes.html#generators
-    if i%8: yield out # flush out the last byte of the row
+    # PROTIP: the row is thresholded into a string of ASCII '0' and '1'
+    # digits, which int() then packs in a single call, instead of
+    # setting bits with a mask one pixel at a time.
+    px = list(islice(v, w)) # never pack more than one row
+    try:
+        bits = bytes(px).translate(_p4_bits_table(t))
+    except ValueError: # values beyond 8 bits are clamped
+        bits = bytes(min(x, 0xFF) for x in px).translate(_p4_bits_table(t))
+    if not bits: return b''
+    n_bytes = -(-len(bits) // PIXELS_PER_BYTE)
+    pad = n_bytes * PIXELS_PER_BYTE - len(bits) # flush out the last byte
+    return (int(bits, 2) << pad).to_bytes(n_bytes, 'big')
 
 # Shell Command Line Handler
 
@@ -428,8 +598,14 @@ PATTERNS_FNS = OrderedDict({
 })
 RASTER_OUT_FNS = OrderedDict({
     'p4': _get_p4_raster,
-    'p5': _get_p5_raster
+    'p5': _get_p5_raster,
+    'scoa': _get_scoa_raster,
 })
+RASTER_WRITE_FNS = OrderedDict({
+    'p4': _write_p4_raster,
+    'p5': _write_p5_raster,
+    'scoa': _write_scoa_raster,
+}) # PROTIP: same as RASTER_OUT_FNS, but for writing to streams
 RESOLUTIONS_F = OrderedDict({
     '600': 1.0,
     '300': 0.5,
@@ -531,14 +707,13 @@ if __name__ == '__main__':
         margin_left=mleft,
         square_size=csz,
     )
-    fn_rast = RASTER_OUT_FNS[args.format]
+    fn_write = RASTER_WRITE_FNS[args.format]
     if True in map(lambda x: x in args.comment, '\x0a\n'):
         raise ValueError('newlines not permitted in comment')
-    _do_out = lambda: bytes(fn_rast(w, h, fn_px, args.comment))
+    _do_out = lambda out: fn_write(out, w, h, fn_px, args.comment)
     if args.out_file:
         with open(expanduser(args.out_file), mode='bx') as f:
-            f.write(_do_out())
-            f.close()
+            _do_out(f)
     else:
-        stdout.buffer.write(_do_out())
+        _do_out(stdout.buffer)
 
@@ -31,8 +31,7 @@ printers.
 #   to decompress all test pages correctly, but further tests are
 #   requried to confirm the accuracy of the decoder.
 #
-import pdb
-from itertools import chain
+from itertools import chain, islice
 from os.path import expanduser
 
 SCOA_OLD_NEW = 0b00 << 6 # uncompressed bytes (old+new)
@@ -140,15 +139,145 @@ class SCoADecoder:
         * ub: iter of uncompressed new bytes
 
         """
-        iterold = (x for x in self._buffer[self._i_buf : self._i_buf+np])
+        iterold = iter(self._buffer[self._i_buf : self._i_buf+np])
         iterrep = (rb for x in range(nr))
-        iternew = (x for x in ub)
+        iternew = iter(ub)
         return chain(iterold, iterrep, iternew)
 
+    def _read_opcode(self, b, nextb):
+        """
+        Parse the SCoA opcode starting with the byte ``b``, calling
+        ``nextb()`` to fetch any further opcode and operand bytes.
+
+        Return a tuple of (np, nr, rb, nu) as accepted by _writeout(),
+        or None at End of Page. The ``nu`` uncompressed bytes that follow
+        the opcode are left for the caller to read from the same source.
+
+        For EOL, np is line_size; the caller must clip old bytes at the
+        end of the line.
+
+        """
+        np = 0 # number of bytes from previous line
+        npx = 0 # number of 0x9f opcodes (np, extended)
+        nl = 0 # pre-count for SCOA_LOLD_WITH_LONG-related opcodes
+        nr = 0 # number of bytes to repeat
+        nu = 0 # number of uncompressed bytes to pass to output
+        rb = 0 # repeating byte as integer value (e.g. 0xFF => 255)
+        n_in = 1 # number of input bytes used by opcode
+        #
+        # first byte
+        #
+        self._b1 = b
+        if b == SCOA_NOP:
+            pass
+        elif b == SCOA_EOL:
+            np = self.line_size
+        elif b == SCOA_EOP:
+            return None
+        elif b & 0xC0 == SCOA_OLD_NEW:
+            np = (b & self.UINT_3_MASK_LO)
+            nu = (b & self.UINT_3_MASK_HI) >> 3
+        elif b & 0xC0 == SCOA_OLD_REPEAT:
+            np = (b & self.UINT_3_MASK_LO)
+            nr = (b & self.UINT_3_MASK_HI) >> 3
+            rb = nextb()
+            n_in += 1
+        elif b & 0xC0 == SCOA_REPEAT_NEW:
+            nr = (b & self.UINT_3_MASK_HI) >> 3
+            nu = b & self.UINT_3_MASK_LO
+            if nr > 0 and nu > 0:
+                rb = nextb()
+                n_in += 1
+            else:
+                # work around repeat+new with zero counts,
+                # suspected to be captfilter encoder bugs,
+                # by holding back input and writing out
+                # zeroes instead
+                nr += nu
+                nu = 0
+        elif b & 0xE0 == SCOA_LONG_OLDB:
+            #
+            # 0x9f or second byte (with old_Long)
+            #
+            while b == SCOA_LONG_OLDB_248:
+                npx += 1
+                b = nextb()
+                n_in += 1
+            if b & 0xE0 == SCOA_LONG_OLDB:
+                # check for the SCOA_LONG_OLDB opcode again,
+                # to handle the case where 0x9f is extending
+                # another SCOA_LONG_OLDB opcode
+                np = (b & self.UINT_5_MASK) << 3
+                self._b1 = b
+                b = nextb()
+                n_in += 1
+            self._b2 = b
+            if b & 0xC0 == SCOA_LOLD_NEWB:
+                np |= b & self.UINT_3_MASK_LO
+                nu = (b & self.UINT_3_MASK_HI) >> 3
+            elif b & 0xC0 == SCOA_LOLD_REPEAT:
+                np |= b & self.UINT_3_MASK_LO
+                nr = (b & self.UINT_3_MASK_HI) >> 3
+                rb = nextb()
+                n_in += 1
+            elif b & 0xE0 == SCOA_LOLD_WITH_LONG:
+                #
+                # third byte (with old_Long)
+                #
+                nl = (b & self.UINT_5_MASK) << 3
+                b = nextb()
+                self._b3 = b
+                n_in += 1
+                if b & 0xC0 == SCOA_LOLD_REPEAT_LONG:
+                    nr = nl | (b & self.UINT_3_MASK_HI) >> 3
+                    np |= b & self.UINT_3_MASK_LO
+                    rb = nextb()
+                    n_in += 1
+                elif b & 0xC0 == SCOA_LOLD_NEW_LONG:
+                    nu = nl | (b & self.UINT_3_MASK_HI) >> 3
+                    np |= b & self.UINT_3_MASK_LO
+        elif b & 0xE0 == SCOA_LONG_REPEAT:
+            #
+            # second byte (no old_Long)
+            #
+            nl = (b & self.UINT_5_MASK) << 3
+            b = nextb()
+            n_in += 1
+            self._b2 = b
+            if b & 0xC0 == SCOA_LR_OLD_NEW_LONG:
+                nu = nl | (b & self.UINT_3_MASK_HI) >> 3
+                np = b & self.UINT_3_MASK_LO
+            elif b & 0xC0 == SCOA_LR_LONG_NEW_REPEAT:
+                nu = nl | (b & self.UINT_3_MASK_LO)
+                nr = (b & self.UINT_3_MASK_HI) >> 3
+                rb = nextb()
+                n_in += 1
+            elif b & 0xC0 == SCOA_LR_OLD_REPEAT_LONG:
+                nr = nl | (b & self.UINT_3_MASK_HI) >> 3
+                np = b & self.UINT_3_MASK_LO
+                rb = nextb()
+                n_in += 1
+            elif b & 0xC0 == SCOA_LR_NEWB:
+                nr = nl | (b & self.UINT_3_MASK_HI) >> 3
+                nu = (b & self.UINT_3_MASK_LO)
+                rb = nextb()
+                n_in += 1
+        else:
+            report = {
+                'offset': self._i_in,
+                'opcode-byte': b
+            }
+            raise ValueError('unrecognised opcode', report)
+        self._i_in += n_in
+        np += 248*npx
+        self._count_9f = npx
+        self._counts = (np, nr, nu)
+        return (np, nr, rb, nu)
+
     def decode(self, biter, debug=False):
         """
-        Decompress an iter yielding bytes from an SCoA-compressed
-        stream ``biter``.
+        Decompress an SCoA-compressed stream ``biter``, which may be
+        an iter yielding bytes, or a bytes-like object.
 
         Return a generator yielding uncompressed bytes.
 
@@ -156,138 +285,24 @@ class SCoADecoder:
         -------
         decoder = SCoADecoder(596)    # A4 width
         file_h = open('page-1.scoa.bin', mode='rb')
-        decoder_iter = decoder.decode(iter(file_h.read()))
-        decoded_bytes = bytes(x for x in decoder_iter)
+        decoder_iter = decoder.decode(file_h.read())
+        decoded_bytes = bytes(decoder_iter)
 
-        An iter is used to avoid having to read entire streams into
+        Iters are accepted to avoid having to read entire streams into
         large buffers.
 
         """
+        biter = iter(biter) # PROTIP: iter() of an iter is the same iter
         self._i_in = 0
         for b in biter:
-            np = 0 # number of bytes from previous line
-            npx = 0 # number of 0x9f opcodes (np, extended)
-            nl = 0 # pre-count for SCOA_LOLD_WITH_LONG-related opcodes
-            nr = 0 # number of bytes to repeat
-            nu = 0 # number of uncompressed bytes to pass to output
-            rb = 0 # repeating byte as integer value (e.g. 0xFF => 255)
-            ub = () # uncompressed byte(s)
-            #
-            # first byte
-            #
-            self._b1 = b
-            if b == SCOA_NOP:
-                pass
-            elif b == SCOA_EOL:
-                np = self.line_size - self._i_buf
-            elif b == SCOA_EOP:
+            op = self._read_opcode(b, biter.__next__)
+            if op is None:
                 return
-                # raise StopIteration
-            elif b & 0xC0 == SCOA_OLD_NEW:
-                np = (b & self.UINT_3_MASK_LO)
-                nu = (b & self.UINT_3_MASK_HI) >> 3
-            elif b & 0xC0 == SCOA_OLD_REPEAT:
-                np = (b & self.UINT_3_MASK_LO)
-                nr = (b & self.UINT_3_MASK_HI) >> 3
-                rb = next(biter)
-                self._i_in += 1
-            elif b & 0xC0 == SCOA_REPEAT_NEW:
-                nr = (b & self.UINT_3_MASK_HI) >> 3
-                nu = b & self.UINT_3_MASK_LO
-                if nr > 0 and nu > 0:
-                    rb = next(biter)
-                else:
-                    # work around repeat+new with zero counts,
-                    # suspected to be captfilter encoder bugs,
-                    # by holding back input iterator and writing
-                    # out zeroes instead
-                    ub = (0x0 for i in range(nu))
-                    nu = 0
-            elif b & 0xE0 == SCOA_LONG_OLDB:
-                #
-                # 0x9f or second byte (with old_Long)
-                #
-                while b == SCOA_LONG_OLDB_248:
-                    npx += 1
-                    b = next(biter)
-                    self._i_in += 1
-                if b & 0xE0 == SCOA_LONG_OLDB:
-                    # check for the SCOA_LONG_OLDB opcode again,
-                    # to handle the case where 0x9f is extending
-                    # another SCOA_LONG_OLDB opcode
-                    np = (b & self.UINT_5_MASK) << 3
-                    self._b1 = b
-                    b = next(biter)
-                    self._i_in += 1
-                self._b2 = b
-                if b & 0xC0 == SCOA_LOLD_NEWB:
-                    np |= b & self.UINT_3_MASK_LO
-                    nu = (b & self.UINT_3_MASK_HI) >> 3
-                elif b & 0xC0 == SCOA_LOLD_REPEAT:
-                    np |= b & self.UINT_3_MASK_LO
-                    nr = (b & self.UINT_3_MASK_HI) >> 3
-                    rb = next(biter)
-                    self._i_in += 1
-                elif b & 0xE0 == SCOA_LOLD_WITH_LONG:
-                    #
-                    # third byte (with old_Long)
-                    #
-                    nl = (b & self.UINT_5_MASK) << 3
-                    b = next(biter)
-                    self._b3 = b
-                    self._i_in += 1
-                    if b & 0xC0 == SCOA_LOLD_REPEAT_LONG:
-                        nr |= nl
-                        nr |= (b & self.UINT_3_MASK_HI) >> 3
-                        np |= b & self.UINT_3_MASK_LO
-                        rb = next(biter)
-                        self._i_in += 1
-                    elif b & 0xC0 == SCOA_LOLD_NEW_LONG:
-                        nu |= nl
-                        nu |= (b & self.UINT_3_MASK_HI) >> 3
-                        np |= b & self.UINT_3_MASK_LO
-            elif b & 0xE0 == SCOA_LONG_REPEAT:
-                #
-                # second byte (no old_Long)
-                #
-                nl = (b & self.UINT_5_MASK) << 3
-                nextb = next(biter)
-                self._i_in += 1
-                self._b2 = nextb
-                if nextb & 0xC0 == SCOA_LR_OLD_NEW_LONG:
-                    nu = nl
-                    nu |= (nextb & self.UINT_3_MASK_HI) >> 3
-                    np |= nextb & self.UINT_3_MASK_LO
-                elif nextb & 0xC0 == SCOA_LR_LONG_NEW_REPEAT:
-                    nu = nl
-                    nu |= nextb & self.UINT_3_MASK_LO
-                    nr = (nextb & self.UINT_3_MASK_HI) >> 3
-                    rb = next(biter)
-                    self._i_in += 1
-                elif nextb & 0xC0 == SCOA_LR_OLD_REPEAT_LONG:
-                    nr = nl | (nextb & self.UINT_3_MASK_HI) >> 3
-                    np |= nextb & self.UINT_3_MASK_LO
-                    rb = next(biter)
-                    self._i_in += 2
-                elif nextb & 0xC0 == SCOA_LR_NEWB:
-                    nr = nl | (nextb & self.UINT_3_MASK_HI) >> 3
-                    nu = (nextb & self.UINT_3_MASK_LO)
-                    rb = next(biter)
-                    self._i_in += 1
-            else:
-                report = {
-                    'offset': self._i_in,
-                    'opcode-byte': b
-                }
-                raise ValueError('unrecognised opcode', report)
-            self._i_in += 1
+            np, nr, rb, nu = op
             # writeout (like opcode execution)
-            total_np = 248*npx + np
-            self._count_9f = npx
-            self._counts = (total_np, nr, nu)
-            if nu > 0:
-                ub = (next(biter) for i in range(nu))
-            for x in self._writeout(np=total_np, nr=nr, rb=rb, ub=ub):
+            ub = (next(biter) for i in range(nu))
+            self._i_in += nu
+            for x in self._writeout(np=np, nr=nr, rb=rb, ub=ub):
                 self._buffer[self._i_buf] = x
                 yield x
                 self._i_buf += 1
@@ -299,6 +314,187 @@ class SCoADecoder:
             self._b2 = None
             self._b3 = None
 
+    def decode_bytes(self, buf):
+        """
+        Decompress a bytes-like object ``buf`` containing an entire
+        SCoA-compressed stream. Return a bytearray of uncompressed bytes.
+
+        The output is the same as bytes(self.decode(buf)), but old,
+        repeated and new bytes are copied in slices instead of being
+        yielded one at a time. Use decode() to monitor the progress of
+        decompression.
+
+        """
+        ls = self.line_size
+        i_start = self._i_buf
+        # PROTIP: the output is prefixed with the line buffer, so that
+        # old bytes are always found one line_size behind the write
+        # position, and the column of offset k is always k % ls
+        out = bytearray(self._buffer)
+        out += out[:i_start]
+        biter = iter(buf)
+        self._i_in = 0
+        try:
+            for b in biter:
+                op = self._read_opcode(b, biter.__next__)
+                if op is None:
+                    break
+                np, nr, rb, nu = op
+                # writeout (like opcode execution)
+                # old bytes never go past the end of the line
+                pos = len(out)
+                np = min(np, ls - pos % ls)
+                if np: out += out[pos-ls:pos-ls+np]
+                if nr: out += bytes((rb,)) * nr
+                if nu:
+                    ub = bytes(islice(biter, nu))
+                    self._i_in += len(ub)
+                    if len(ub) < nu: raise StopIteration
+                    out += ub
+        except StopIteration:
+            raise ValueError(
+                'unexpected end of stream', {'offset': self._i_in}
+            ) from None
+        # update decoder state, as if decode() was used
+        end = len(out)
+        self._buffer = [0,] * ls
+        for k in range(end-ls, end): self._buffer[k % ls] = out[k]
+        self._i_buf = end % ls
+        self._i_line += end // ls - 1
+        del out[:ls+i_start]
+        self._b1 = None
+        self._b2 = None
+        self._b3 = None
+        return out
+
+class SCoAEncoder:
+    """
+    SCoA Encoder Object to compress 1-bit rasters into SCoA streams that
+    SCoADecoder can decompress.
+
+    The encoder only uses a small subset of SCoA opcodes (old, repeat
+    and new bytes, End of Line and End of Page), and is not intended to
+    reproduce the output of captfilter. It is mainly for creating
+    test streams.
+
+    """
+    def __init__(self, line_size, **kwargs):
+        """
+        Create an SCoA encoder object.
+
+        The ``line_size`` argument sets the byte length of each line of
+        the input bitmap.
+
+        Keyword Arguments
+        -----------------
+        * init_value: assume that the line before the first line is
+          filled with this repeating single-byte pattern. This must
+          match the init_value of the decoder.
+
+        """
+        if type(line_size) is not int: raise TypeError('line_size must be int')
+        initv = kwargs.get('init_value', b'\x00')
+        if type(initv) is not bytes:
+            raise TypeError('init_value must be a single byte')
+        elif len(initv) > 1:
+            raise ValueError('init_value must be a single byte')
+
+        self.line_size = line_size
+        self._prev = initv * line_size
+
+    @staticmethod
+    def _old(np):
+        """Return opcodes to copy np bytes from the previous line"""
+        n_248, np = divmod(np, 248)
+        out = bytearray((SCOA_LONG_OLDB_248,)) * n_248
+        if np >= 8:
+            out.append(SCOA_LONG_OLDB | np >> 3)
+            out.append(SCOA_LOLD_NEWB | np & 0x7)
+        elif np or n_248:
+            out.append(SCOA_OLD_NEW | np) # SCOA_LOLD_NEWB after 0x9f
+        return out
+
+    @staticmethod
+    def _repeat(nr, rb):
+        """Return opcodes to repeat byte value rb nr times"""
+        out = bytearray()
+        while nr > 0:
+            n = min(nr, 255)
+            if n >= 8:
+                out.append(SCOA_LONG_REPEAT | n >> 3)
+                out.append(SCOA_LR_NEWB | (n & 0x7) << 3)
+            else:
+                out.append(SCOA_OLD_REPEAT | n << 3)
+            out.append(rb)
+            nr -= n
+        return out
+
+    @staticmethod
+    def _new(ub):
+        """Return opcodes to pass uncompressed bytes ub to the output"""
+        out = bytearray()
+        for i in range(0, len(ub), 255):
+            chunk = ub[i:i+255]
+            n = len(chunk)
+            if n >= 8:
+                out.append(SCOA_LONG_REPEAT | n >> 3)
+                out.append(SCOA_LR_OLD_NEW_LONG | (n & 0x7) << 3)
+            else:
+                out.append(SCOA_OLD_NEW | n << 3)
+            out += chunk
+        return out
+
+    def encode_line(self, line):
+        """
+        Compress a single line of ``line_size`` bytes, ``line``, against
+        the previous line. Return a bytearray of the SCoA stream for the
+        line.
+
+        """
+        ls = self.line_size
+        if len(line) != ls: raise ValueError('line must be line_size bytes')
+        prev = self._prev
+        self._prev = bytes(line)
+        out = bytearray()
+        i = 0
+        while i < ls:
+            # old bytes, same as in the previous line
+            j = i
+            while j < ls and line[j] == prev[j]: j += 1
+            if j >= ls:
+                out.append(SCOA_EOL) # rest of line is the same
+                break
+            out += self._old(j-i)
+            # repeated bytes
+            k = j + 1
+            while k < ls and line[k] == line[j]: k += 1
+            if k - j > 1:
+                out += self._repeat(k-j, line[j])
+                i = k
+                continue
+            # new bytes, until old or repeated bytes can take over
+            while k < ls and line[k] != prev[k]\
+                and not (k+1 < ls and line[k] == line[k+1]): k += 1
+            out += self._new(line[j:k])
+            i = k
+        return out
+
+    def encode(self, lines):
+        """
+        Compress an iter of lines of ``line_size`` bytes, ``lines``.
+        Return a generator yielding the SCoA stream one line at a time,
+        followed by an End of Page opcode.
+
+        Example
+        -------
+        encoder = SCoAEncoder(596)    # A4 width
+        stream = b''.join(encoder.encode(rows))
+
+        """
+        for line in lines:
+            yield self.encode_line(line)
+        yield bytes((SCOA_EOP,))
+
 def _read_scoa_file_header(fh):
     """
     Read Studycapt SCoA-compressed P4 Bitmap Header, return dimensions
@@ -340,8 +536,9 @@ def _scoa_file_iter(path, width=None, data_size=None):
     with open(expanduser(path), mode='rb') as fh:
         img_w, _, size = _read_scoa_file_header(fh)
         if width: img_w = width
-        decoder = SCoADecoder(img_w//8, init_value=b'\xf0')
-        return (decoder.decode(iter(fh.read())), decoder)
+        # P4 rows are padded to whole bytes, see sample_blots._p4_body()
+        decoder = SCoADecoder(-(-img_w // 8), init_value=b'\xf0')
+        return (decoder.decode(fh.read()), decoder)
 
 def scoa_file_to_p4(path, width=None, height=None):
     """
@@ -381,13 +578,12 @@ def scoa_file_to_p4(path, width=None, height=None):
         else:
             img_w = fw
             img_h = fh
-        if img_w % 8 > 0: raise ValueError('width must be divisible by 8')
-        if img_h % 8 > 0: raise ValueError('height must be divisible by 8')
-        decoder = SCoADecoder(img_w//8, init_value=b'\xf0')
-        decoder_iter = decoder.decode(iter(scoafile.read(size)))
+        # P4 rows are padded to whole bytes, see sample_blots._p4_body()
+        decoder = SCoADecoder(-(-img_w // 8), init_value=b'\xf0')
         p4_header = "P4\n{} {}\n".format(img_w, img_h)
-        out_chain = chain(bytes(p4_header, encoding='ascii'), decoder_iter)
-        return bytes(out_chain)
+        out = bytearray(p4_header, encoding='ascii')
+        out += decoder.decode_bytes(scoafile.read(size))
+        return bytes(out)
 
 # decoders for manual testing
 testdec8 = SCoADecoder(8, init_value=b'\x0f')
@@ -5,55 +5,44 @@ Quick and Dirty Blob Visualiser (blob_pic.py) Unit Tests
 from unittest import TestCase
 import blob_pic
 
-class HelperFunctionTests(TestCase):
-    # _intble_iter() tests
-    #
-    def test_intble_iter_valid(self):
-        INTBLE_ITER_VALID_CASES = {
-            'neg_one_byte': {
-                'v': -6,
-                'l': 1,
-                'expected': b'\xfa'
-            },
-            'neg_multi_byte': {
-                'v': -300,
-                'l': 2,
-                'expected': b'\xd4\xfe'
-            },
-            'pos_one_byte': {
-                'v': 1,
-                'l': 1,
-                'expected': b'\x01'
-            },
-            'pos_multi_byte': {
-                'v': 260,
-                'l': 2,
-                'expected': b'\x04\x01'
-            },
-            'pos_small_multi_byte': {
-                'v': 2,
-                'l': 3,
-                'expected': b'\x02\x00\x00'
-            },
-            'zero_one_byte': {
-                'v': 0,
-                'l': 1,
-                'expected': b'\x00'
-            },
-            'zero_multi_byte': {
-                'v': 0,
-                'l': 5,
-                'expected': b'\x00\x00\x00\x00\x00'
-            }
+class BlobPicTests(TestCase):
+    def test_bmp(self):
+        BLOB_PIC_BMP_CASES = {
+            '1bpp_8x8': {
+                'w': 8,
+                'h': 8,
+                'blob': b'\x00\x42\x00\x00\x00\x00\x42\x00',
+                'bpp': 1,
+                'expected': bytes.fromhex(
+                    '424d5e000000000000003e000000' # file header
+                    '2800000008000000f8ffffff0100010000000000'
+                    '0000000058020000580200000200000000000000'
+                    'fff000ffc8eeeeff'             # colours
+                    '00000000420000000000000000000000'
+                    '00000000000000004200000000000000'
+                ),
+            },
+            '24bpp_1x2': {
+                'w': 1,
+                'h': 2,
+                'blob': b'\x01\x02\x03\x04\x05\x06',
+                'bpp': 24,
+                'expected': bytes.fromhex(
+                    '424d3e000000000000003600000028000000'
+                    '01000000feffffff010018000000000000000000'
+                    '58020000580200000000000000000000'
+                    '0102030004050600'
+                ),
+            },
         }
-        for k in INTBLE_ITER_VALID_CASES.keys():
+        for k in BLOB_PIC_BMP_CASES.keys():
             with self.subTest(test=k):
-                tcase = INTBLE_ITER_VALID_CASES[k] # contains arguments
+                tcase = BLOB_PIC_BMP_CASES[k]
                 expected = tcase.pop('expected')
-                result = bytes(blob_pic._intble_iter(**tcase))
+                pic = blob_pic.BlobPic(**tcase)
+                result = pic.bmp()
                 self.assertEqual(result, expected)
 
-class BlobPicTests(TestCase):
     def test_bmp_wpad(self):
         BLOB_PIC_BMP_WPAD_CASES = {
             '1bpp_8x8': {
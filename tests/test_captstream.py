@@ -15,7 +15,9 @@ CAPT Job File and Stream Toolkit (captstream.py) Unit Tests
 # along with this software. If not, see:
 # <http://creativecommons.org/publicdomain/zero/1.0/>.
 
+from tempfile import TemporaryDirectory
 from unittest import TestCase
+from unittest.mock import patch
 import captstream
 import os.path
 
@@ -106,6 +108,51 @@ class CAPTStreamTests(TestCase):
             )),
             'expected': b'\x9a\x9a\x9a\x9a\x9b\x9b\x9b\x9b',
         },
+        'contiguous_pos': {
+            'input': b''.join((
+                CARRIER_OPCODE, b'\x08\x00', b'\x9a'*4,
+                CARRIER_OPCODE, b'\x08\x00', b'\x9b'*4,
+                END_OPCODE, b'\x04\x00',
+                OTHER_OPCODE, b'\x08\x00', b'\x00'*4,
+            )),
+            'expected': b'\x9a\x9a\x9a\x9a\x9b\x9b\x9b\x9b',
+            'expected_pos': 20,
+        },
+        'contiguous_start': {
+            'input': b''.join((
+                CARRIER_OPCODE, b'\x08\x00', b'\x9a'*4,
+                CARRIER_OPCODE, b'\x08\x00', b'\x9b'*4,
+                END_OPCODE, b'\x04\x00',
+            )),
+            'start': 8,
+            'expected': b'\x9b\x9b\x9b\x9b',
+            'expected_pos': 20,
+        },
+        'contiguous_end': {
+            'input': b''.join((
+                CARRIER_OPCODE, b'\x08\x00', b'\x9a'*4,
+                CARRIER_OPCODE, b'\x08\x00', b'\x9b'*4,
+                CARRIER_OPCODE, b'\x08\x00', b'\x9c'*4,
+                END_OPCODE, b'\x04\x00',
+            )),
+            'end': 16,
+            'expected': b'\x9a\x9a\x9a\x9a\x9b\x9b\x9b\x9b',
+            'expected_pos': 16,
+        },
+        'fragmented_start_end': {
+            'input': b''.join((
+                CARRIER_OPCODE, b'\x08\x00', b'\x9a'*4,
+                OTHER_OPCODE, b'\x08\x00', b'\x00'*4,
+                CARRIER_OPCODE, b'\x08\x00', b'\x9b'*4,
+                OTHER_OPCODE, b'\x08\x00', b'\x00'*4,
+                CARRIER_OPCODE, b'\x08\x00', b'\x9c'*4,
+                END_OPCODE, b'\x04\x00',
+            )),
+            'start': 8,
+            'end': 32,
+            'expected': b'\x9b\x9b\x9b\x9b',
+            'expected_pos': 32,
+        },
     }
     cfi = captstream.CAPTStream(None, version=1)
     def test_extract_packets(self):
@@ -114,12 +161,81 @@ class CAPTStreamTests(TestCase):
                 tcase = self.EXTRACT_PACKET_CASES[k]
                 n = tcase.get('n')
                 yend = tcase.get('yield_end', False)
-                in_iter = (x for x in tcase['input'])
-                sample = bytes(self.cfi.extract_packets(
-                    in_iter, self.CARRIER_OPCODE, self.END_OPCODE, n, yend
+                sample = b''.join(self.cfi.extract_packets(
+                    tcase['input'], self.CARRIER_OPCODE, self.END_OPCODE, n, yend,
+                    start=tcase.get('start', 0), end=tcase.get('end')
                 ))
                 expected = tcase['expected']
                 self.assertEqual(sample, expected)
+                if 'expected_pos' in tcase:
+                    self.assertEqual(self.cfi._pos, tcase['expected_pos'])
+
+    # extract_raster_dims() tests
+    #
+    # PROTIP: the line width and height are at offsets 26 and 28 of
+    # the raster setup packet's payload
+    RASTER_SETUP_PACKET = b''.join((
+        captstream.CAPT_RASTER_SETUP, b'\x24\x00', b'\x00'*26,
+        b'\x4e\x00', b'\x6c\x02', b'\x00'*2,
+    ))
+    EXTRACT_RASTER_DIMS_CASES = {
+        'setup_at_start': {
+            'input': RASTER_SETUP_PACKET,
+            'expected': (78, 620),
+            'expected_pos': 36,
+        },
+        'setup_after_start': {
+            'input': b''.join((
+                OTHER_OPCODE, b'\x08\x00', b'\x00'*4,
+                RASTER_SETUP_PACKET,
+                CARRIER_OPCODE, b'\x08\x00', b'\x9a'*4,
+            )),
+            'start': 4,
+            'expected': (78, 620),
+            'expected_pos': 44,
+        },
+    }
+    EXTRACT_RASTER_DIMS_END_CASES = {
+        'no_setup': {
+            'input': b''.join((CARRIER_OPCODE, b'\x08\x00', b'\x9a'*4)),
+        },
+        'setup_before_start': {
+            'input': b''.join((
+                RASTER_SETUP_PACKET,
+                CARRIER_OPCODE, b'\x08\x00', b'\x9a'*4,
+            )),
+            'start': 36,
+        },
+        'setup_after_end': {
+            'input': b''.join((
+                CARRIER_OPCODE, b'\x08\x00', b'\x9a'*4,
+                RASTER_SETUP_PACKET,
+            )),
+            'end': 8,
+        },
+        'setup_truncated': {
+            'input': RASTER_SETUP_PACKET[:30],
+        },
+    }
+
+    def test_extract_raster_dims(self):
+        for k in self.EXTRACT_RASTER_DIMS_CASES.keys():
+            with self.subTest(test=k):
+                tcase = self.EXTRACT_RASTER_DIMS_CASES[k]
+                sample = self.cfi.extract_raster_dims(
+                    tcase['input'], tcase.get('start', 0), tcase.get('end')
+                )
+                self.assertEqual(sample, tcase['expected'])
+                self.assertEqual(self.cfi._pos, tcase['expected_pos'])
+
+    def test_extract_raster_dims_end(self):
+        for k in self.EXTRACT_RASTER_DIMS_END_CASES.keys():
+            with self.subTest(test=k):
+                tcase = self.EXTRACT_RASTER_DIMS_END_CASES[k]
+                with self.assertRaises(StopIteration):
+                    self.cfi.extract_raster_dims(
+                        tcase['input'], tcase.get('start', 0), tcase.get('end')
+                    )
 
     # packet_first_offsets() tests
     #
@@ -182,10 +298,9 @@ class CAPTStreamTests(TestCase):
         for k in self.PFO_CASES.keys():
             with self.subTest(test=k):
                 tcase = self.PFO_CASES[k]
-                in_iter = (x for x in tcase['input'])
                 sample = [
                     x for x in self.cfi._packet_first_offsets(
-                        in_iter, self.ALL_OPCODES
+                        tcase['input'], self.ALL_OPCODES
                     )
                 ]
                 expected = tcase['expected']
@@ -194,6 +309,63 @@ class CAPTStreamTests(TestCase):
     def test_malformed_input(self):
         raise NotImplementedError('TODO: write malformed input tests')
 
+class JobFileTests(TestCase):
+
+    # get_page() tests with a small CAPT 1 job file
+    #
+    MAGIC = b'\x01\x00\x18\x00\xCE\xDA\xDE\xFA'
+    # PROTIP: the page header is 106 bytes before the raster setup
+    PAGE_HEADER = b''.join((b'\x40\xb0', b'\x6a\x00', b'\x00'*102))
+    RASTER_SETUP = b''.join((
+        captstream.CAPT_RASTER_SETUP, b'\x24\x00', b'\x00'*26,
+        b'\x02\x00', b'\x03\x00', b'\x00'*2,
+    )) # line_size == 2, height == 3
+    RASTER_END = b''.join((captstream.CAPT_RASTER_END, b'\x04\x00'))
+    DATA = captstream.SCOA_RASTER_DATA
+    JOB = b''.join((
+        MAGIC,
+        PAGE_HEADER, RASTER_SETUP,
+        DATA, b'\x08\x00', b'\x9a'*4,
+        DATA, b'\x06\x00', b'\x9b'*2,
+        RASTER_END,
+        PAGE_HEADER, RASTER_SETUP,
+        DATA, b'\x07\x00', b'\x9c'*3,
+        RASTER_END,
+    ))
+    GET_PAGE_CASES = {
+        1: b'SCOA\n16 3\n6\n\x9a\x9a\x9a\x9a\x9b\x9b',
+        2: b'SCOA\n16 3\n3\n\x9c\x9c\x9c',
+    }
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'job.capt')
+        with open(self.path, mode='wb') as fh:
+            fh.write(self.JOB)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _check_pages(self):
+        cs = captstream.CAPTStream(self.path)
+        self.assertEqual(cs.version(), 1)
+        for k in self.GET_PAGE_CASES.keys():
+            with self.subTest(page=k):
+                sample = cs.get_page(k, 'raw')
+                self.assertEqual(sample, self.GET_PAGE_CASES[k])
+        return cs
+
+    def test_get_page_mmap(self):
+        cs = self._check_pages()
+        self.assertIsInstance(cs._buf, captstream.mmap)
+        del cs
+
+    def test_get_page_read(self):
+        with patch('captstream.mmap', side_effect=OSError):
+            cs = self._check_pages()
+        self.assertIsInstance(cs._buf, bytes)
+        del cs
+
 class CommandLineTests(TestCase):
 
     # _auto_number_filename() test
@@ -15,8 +15,11 @@ RLE Test Page Generator (sample_blots.py) Unit Tests
 # along with this software. If not, see:
 # <http://creativecommons.org/publicdomain/zero/1.0/>.
 
+from os.path import join
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 import sample_blots
+import scoa
 try:
     from hashlib import blake2s
     hashcls = blake2s
@@ -120,3 +123,31 @@ class P4Tests(TestCase):
         self.assertEqual([x for x in sample_7], [254,])
         sample_31 = sample_blots._p4_get_row(31, [self.VALUE,]*31, self.VALUE)
         self.assertEqual([x for x in sample_31], [255, 255, 255, 254])
+
+    def test_p4_get_row_overlong(self):
+        """Get a P4 row from pixel values that run past the row"""
+        sample_7 = sample_blots._p4_get_row(7, iter([self.VALUE,]*20), self.VALUE)
+        self.assertEqual([x for x in sample_7], [254,])
+
+class ScoaOutputTests(TestCase):
+
+    SCOA_ROUND_TRIP_CASES = {
+        'circle_270k': sample_blots._mk_fn_circle,
+        'half_diagonal_270k': sample_blots._mk_fn_half_diagonal,
+        'mirrored_incr_runs_270k': sample_blots._mk_fn_mirrored_incr_runs,
+        'all_set_270k': sample_blots._mk_fn_all_set,
+    }
+
+    def test_scoa_file_to_p4(self):
+        """SCoA output must read back as the same P4 raster"""
+        w = ARGS_MKFN_270K['w'] # PROTIP: neither w nor h is divisible by 8
+        h = ARGS_MKFN_270K['h']
+        for k in self.SCOA_ROUND_TRIP_CASES.keys():
+            mk_fn = self.SCOA_ROUND_TRIP_CASES[k]
+            with self.subTest(test=k), TemporaryDirectory() as d:
+                path = join(d, 'sample.scoa')
+                with open(path, mode='wb') as f:
+                    f.write(sample_blots._get_scoa_raster(w, h, mk_fn(w, h)))
+                p4_body = sample_blots._p4_body(w, h, mk_fn(w, h))
+                samp = scoa.scoa_file_to_p4(path)
+                self.assertEqual(samp, b'P4\n438 620\n' + p4_body)
@@ -153,6 +153,30 @@ class ScoaDecoderTests(TestCase):
                 samp = bytes(sd.decode(iter(testdata['input'])))
                 self.assertEqual(samp, testdata['expected'])
 
+    def test_decode_bytes_like(self):
+        """Bytes-like objects must decode the same way as iters"""
+        for k in self.DECODE_CASES.keys():
+            testdata = self.DECODE_CASES[k]
+            with self.subTest(test=k, input=testdata['input']):
+                sd = scoa.SCoADecoder(**testdata['init_args'])
+                samp = bytes(sd.decode(memoryview(testdata['input'])))
+                self.assertEqual(samp, testdata['expected'])
+
+    def test_decode_bytes(self):
+        for k in self.DECODE_CASES.keys():
+            testdata = self.DECODE_CASES[k]
+            with self.subTest(test=k, input=testdata['input']):
+                sd = scoa.SCoADecoder(**testdata['init_args'])
+                samp = bytes(sd.decode_bytes(testdata['input']))
+                self.assertEqual(samp, testdata['expected'])
+
+    def test_decode_bytes_buffer_overflow(self):
+        """decode_bytes() must leave the buffer as decode() does"""
+        sd = scoa.SCoADecoder(8, init_value=b'\xf0')
+        out = sd.decode_bytes(b'\x78\x90\x50\x91')
+        self.assertEqual(bytes(out), b'\x90\x90\x90\x90\x90\x90\x90\x91\x91')
+        self.assertEqual(bytes(sd._buffer), b'\x91\x90\x90\x90\x90\x90\x90\x91')
+
     def test_decode_buffer_full_line(self):
         """The buffer must hold a copy of the previous line"""
         sd = scoa.SCoADecoder(8, init_value=b'\xf0')
@@ -169,3 +193,49 @@ class ScoaDecoderTests(TestCase):
         self.assertEqual(bytes(out), b'\x90\x90\x90\x90\x90\x90\x90\x91\x91')
         self.assertEqual(bytes(sd._buffer), b'\x91\x90\x90\x90\x90\x90\x90\x91')
 
+
+class ScoaEncoderTests(TestCase):
+
+    ENCODE_CASES = {
+        'same_as_init': {
+            'init_args': {'line_size': LINE_SIZE, 'init_value': b'\xf0'},
+            'lines': (b'\xf0'*8,),
+            'expected': b'\x41\x42',
+        },
+        'repeat': {
+            'init_args': {'line_size': LINE_SIZE, 'init_value': b'\xf0'},
+            'lines': (b'\xff'*8, b'\xff'*8),
+            'expected': b'\xa1\x00\xff\x41\x42',
+        },
+        'new': {
+            'init_args': {'line_size': LINE_SIZE, 'init_value': b'\xf0'},
+            'lines': (b'\x00\x01\x02\x03\x04\x05\x06\x07',),
+            'expected': b'\xa1\xc0\x00\x01\x02\x03\x04\x05\x06\x07\x42',
+        },
+        'old_then_repeat_then_new': {
+            'init_args': {'line_size': LINE_SIZE, 'init_value': b'\xf0'},
+            'lines': (b'\xf0\xf0\x90\x90\x90\x01\x02\x03',),
+            'expected': b'\x02\x58\x90\x18\x01\x02\x03\x42',
+        },
+    }
+
+    def test_encode(self):
+        for k in self.ENCODE_CASES.keys():
+            testdata = self.ENCODE_CASES[k]
+            with self.subTest(test=k):
+                se = scoa.SCoAEncoder(**testdata['init_args'])
+                samp = b''.join(se.encode(testdata['lines']))
+                self.assertEqual(samp, testdata['expected'])
+
+    def test_encode_decode_long(self):
+        """Long lines must decode back to the same lines"""
+        lines = (
+            bytes(range(256)) * 3 + b'\x00' * 232,
+            b'\x00' * 1000,
+            bytes(range(256)) * 3 + b'\x00' * 200 + b'\xff' * 32,
+            b'\xff' * 999 + b'\x00',
+        )
+        se = scoa.SCoAEncoder(LINE_SIZE_LONG, init_value=b'\xf0')
+        sd = scoa.SCoADecoder(LINE_SIZE_LONG, init_value=b'\xf0')
+        stream = b''.join(se.encode(lines))
+        self.assertEqual(bytes(sd.decode_bytes(stream)), b''.join(lines))